@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Build script to compile manual_core.py with Cython (optional speed-up)
+
+The compiled extension sits next to manual_core.py and is imported in its
+place, so the string helpers (generate_topic_id, detect_emergency_procedure,
+extract_units, detect_doc_type, ...) run without bytecode dispatch. The
+source is unchanged and keeps working on its own.
+
+Rebuild after editing manual_core.py, or run with --clean to remove the
+extension: a stale build would otherwise shadow the edited source.
+"""
+
+import glob
+import os
+import subprocess
+import sys
+
+MODULE = "manual_core"
+
+def install_cython():
+    """Install Cython if not already installed"""
+    try:
+        import Cython  # noqa: F401
+    except ImportError:
+        print("Installing Cython...")
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "cython"])
+
+def built_extensions():
+    """Compiled manual_core extension files in this directory"""
+    return glob.glob(f"{MODULE}.*.so") + glob.glob(f"{MODULE}.*.pyd")
+
+def clean():
+    """Remove the compiled extension and generated C source"""
+    for path in built_extensions() + [f"{MODULE}.c"]:
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"Removed {path}")
+
+def build_extension():
+    """Compile manual_core.py in place"""
+    from Cython.Build import cythonize
+    from setuptools import Extension, setup
+
+    print(f"Compiling {MODULE}.py with Cython...")
+    setup(
+        name=MODULE,
+        ext_modules=cythonize(
+            [Extension(MODULE, [f"{MODULE}.py"])],
+            compiler_directives={"language_level": 3},
+            quiet=True,
+        ),
+        script_args=["build_ext", "--inplace", "--build-temp", "build"],
+    )
+
+    print("\n" + "="*60)
+    print("Build complete!")
+    print(f"Compiled module: {', '.join(built_extensions())}")
+    print(f"Remove it with: python {os.path.basename(__file__)} --clean")
+    print("="*60)
+
+def main():
+    if "--clean" in sys.argv[1:]:
+        clean()
+        return
+    try:
+        install_cython()
+        build_extension()
+    except subprocess.CalledProcessError as e:
+        print(f"Error during build: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
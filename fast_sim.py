@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+fast_sim.py - Optional Numba-compiled similarity kernel
+Drop-in replacement for manual_core.cosine_topk, enabled with
+`python manual_gui.py --jit`. Without Numba installed it falls back to
+the NumPy version in manual_core.
+"""
+
+import numpy as np
+
+# Try to import Numba
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+import manual_core
+
+NUMBA_AVAILABLE = njit is not None
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _cosine_scores(q, m):
+        # One fused pass per row: dot product and norm together
+        n, d = m.shape
+        qn = 0.0
+        for j in range(d):
+            qn += q[j] * q[j]
+        qn = np.sqrt(qn)
+        out = np.zeros(n)
+        if qn == 0.0:
+            return out
+        for i in prange(n):
+            dot = 0.0
+            mn = 0.0
+            for j in range(d):
+                dot += m[i, j] * q[j]
+                mn += m[i, j] * m[i, j]
+            if mn > 0.0:
+                out[i] = dot / (np.sqrt(mn) * qn)
+        return out
+
+
+def cosine_topk(query, vectors, k: int):
+    """Same contract as manual_core.cosine_topk, scored by the Numba kernel."""
+    if not NUMBA_AVAILABLE:
+        return manual_core.cosine_topk(query, vectors, k)
+    if len(vectors) == 0 or k <= 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float64)
+    q = np.ascontiguousarray(query, dtype=np.float64)
+    m = np.ascontiguousarray(vectors, dtype=np.float64)
+    sims = _cosine_scores(q, m)
+    k = min(k, len(sims))
+    idx = np.argpartition(-sims, k - 1)[:k]
+    idx = idx[np.argsort(-sims[idx], kind="stable")]
+    return idx, sims[idx]
+
+
+def install():
+    """
+    Route manual_core's ask/gap scoring through the Numba kernel and
+    compile it now (first call pays the JIT cost). Returns False, leaving
+    manual_core untouched, if Numba is not installed.
+    """
+    if not NUMBA_AVAILABLE:
+        return False
+    cosine_topk(np.ones(2), np.ones((2, 2)), 1)
+    manual_core.cosine_topk = cosine_topk
+    return True
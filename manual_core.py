@@ -5,36 +5,73 @@
 
 import os
 import json
-import math
 import argparse
 import csv
 import re
 import sys
 import sqlite3
 import pickle
+import hashlib
+import threading
 from datetime import datetime
 from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 
-from openai import OpenAI
+# orjson for fast db.json load/save (optional, falls back to stdlib json)
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-# FAISS for vector similarity search
+# regex for the unit scanner (optional, faster than re on that pattern)
 try:
-    import faiss
+    import regex
 except ImportError:
-    faiss = None
-    print("Warning: FAISS not installed. Vector search will use fallback method.", file=sys.stderr)
+    regex = None
 
-# Initialize OpenAI client
-# The API key should be set via OPENAI_API_KEY environment variable
-# or in a .env file
+# pyahocorasick for the keyword detectors (optional, falls back to substring scans)
 try:
-    client = OpenAI()
-except Exception as e:
-    # Client will be None if API key is not set
-    # Functions that need it will show appropriate error messages
-    client = None
-    print(f"Warning: OpenAI client initialization skipped: {e}", file=sys.stderr)
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# The OpenAI SDK and FAISS are slow to import, so both are loaded on first
+# use (get_client / get_faiss) rather than at module import. This keeps
+# "import manual_core" cheap for the GUI and the metadata-only CLI commands.
+_UNSET = object()
+client = _UNSET
+faiss = _UNSET
+
+def get_client():
+    """
+    Return the shared OpenAI client, creating it on first call.
+    The API key should be set via OPENAI_API_KEY environment variable
+    or in a .env file.
+    """
+    global client
+    if client is _UNSET:
+        try:
+            from openai import OpenAI
+            client = OpenAI()
+        except Exception as e:
+            # Client will be None if API key is not set
+            client = None
+            print(f"Warning: OpenAI client initialization skipped: {e}", file=sys.stderr)
+    if client is None:
+        raise RuntimeError("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
+    return client
+
+def get_faiss():
+    """Return the faiss module (FAISS vector similarity search), or None if not installed."""
+    global faiss
+    if faiss is _UNSET:
+        try:
+            import faiss as _faiss
+            faiss = _faiss
+        except ImportError:
+            faiss = None
+            print("Warning: FAISS not installed. Vector search will use fallback method.", file=sys.stderr)
+    return faiss
 
 # -----------------------------------------
 # CONFIG
@@ -473,10 +510,17 @@ def ensure_dirs():
 def load_db() -> Dict[str, Any]:
     if not os.path.isfile(DB_PATH):
         return {"chunks": []}
+    if orjson is not None:
+        with open(DB_PATH, "rb") as f:
+            return orjson.loads(f.read())
     with open(DB_PATH, "r", encoding="utf-8") as f:
         return json.load(f)
 
 def save_db(db: Dict[str, Any]):
+    if orjson is not None:
+        with open(DB_PATH, "wb") as f:
+            f.write(orjson.dumps(db, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        return
     with open(DB_PATH, "w", encoding="utf-8") as f:
         json.dump(db, f, ensure_ascii=False, indent=2)
 
@@ -484,9 +528,19 @@ def save_db(db: Dict[str, Any]):
 # SQLite Database Layer (Phase 1)
 # -----------------------------------------
 
+# Shared by init_sqlite_db and ensure_indexes (older DBs lack the table)
+CHUNK_UNITS_DDL = '''
+    CREATE TABLE IF NOT EXISTS chunk_units (
+        chunk_id TEXT,
+        unit TEXT,
+        value TEXT,
+        FOREIGN KEY (chunk_id) REFERENCES chunks(id)
+    )
+'''
+
 def init_sqlite_db():
     """Initialize SQLite database with schema."""
-    conn = sqlite3.connect(SQLITE_DB_PATH)
+    conn = sqlite3.connect(SQLITE_DB_PATH, uri=True)
     cursor = conn.cursor()
     
     # Documents table
@@ -550,6 +604,10 @@ def init_sqlite_db():
         )
     ''')
     
+    # Units found in each chunk, one row per occurrence (queryable by unit;
+    # chunks.units keeps the same data as JSON for compatibility)
+    cursor.execute(CHUNK_UNITS_DDL)
+    
     # Phase 1.5: Conflict Resolutions table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS conflict_resolutions (
@@ -595,12 +653,108 @@ def init_sqlite_db():
         )
     ''')
     
+    ensure_indexes(conn)
+
     conn.commit()
     conn.close()
 
-def get_db_connection():
-    """Get SQLite database connection."""
-    return sqlite3.connect(SQLITE_DB_PATH)
+# DB paths whose indexes have already been checked in this process
+_INDEXED_DBS = set()
+
+def ensure_indexes(conn):
+    """Create secondary indexes and the chunk_units table (idempotent). Older DBs predate these."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_manual_id ON chunks(manual_id)")
+    conn.execute(CHUNK_UNITS_DDL)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_units_unit ON chunk_units(unit)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_units_chunk_id ON chunk_units(chunk_id)")
+    _INDEXED_DBS.add(SQLITE_DB_PATH)
+
+class _ThreadConnection(sqlite3.Connection):
+    """
+    Connection cached per thread by get_db_connection. Callers still
+    close() it when done; that ends any open transaction and restores the
+    default transaction mode, but keeps the handle for the next caller.
+    """
+    # (st_dev, st_ino) of the DB file when opened; see _db_file_id
+    file_id = None
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+        self.isolation_level = ""
+
+    def release(self):
+        """Really close the handle (close() only resets it for reuse)."""
+        sqlite3.Connection.close(self)
+
+def _db_file_id(path: str):
+    """(st_dev, st_ino) of a plain DB file path; None for URIs or a missing file."""
+    if path.startswith("file:") or path == ":memory:":
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+# Per-thread {db path: connection}; a thread's connections are closed
+# when the thread (and so its local storage) goes away
+_thread_conns = threading.local()
+
+def close_db_connection():
+    """Really close this thread's cached connection to SQLITE_DB_PATH, if any."""
+    conns = getattr(_thread_conns, "by_path", None)
+    conn = conns.pop(SQLITE_DB_PATH, None) if conns else None
+    if conn is not None:
+        conn.release()
+
+# Prepared statements kept per cached connection (sqlite3 default: 128)
+CACHED_STATEMENTS = 256
+
+def get_db_connection(check_same_thread: bool = True):
+    """
+    Get SQLite database connection.
+    SQLITE_DB_PATH may also be a "file:" URI (e.g. a shared in-memory DB
+    for tests); plain paths are unaffected.
+    
+    Connections are reused per thread and path, so repeated calls skip
+    the open. If the file at the path was replaced (deleted and
+    recreated, e.g. by migrate_db), the stale connection is closed and a
+    new one opened. check_same_thread=False (a connection shared across
+    threads) always opens a new one that the caller owns.
+    """
+    if not check_same_thread:
+        conn = sqlite3.connect(SQLITE_DB_PATH, check_same_thread=False, uri=True)
+    else:
+        conns = getattr(_thread_conns, "by_path", None)
+        if conns is None:
+            conns = _thread_conns.by_path = {}
+        conn = conns.get(SQLITE_DB_PATH)
+        if conn is not None:
+            if conn.file_id == _db_file_id(SQLITE_DB_PATH):
+                return conn
+            # Writes through the old handle would go to an unlinked file
+            del conns[SQLITE_DB_PATH]
+            conn.release()
+            _INDEXED_DBS.discard(SQLITE_DB_PATH)
+        conn = sqlite3.connect(
+            SQLITE_DB_PATH, uri=True, factory=_ThreadConnection,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        conn.file_id = _db_file_id(SQLITE_DB_PATH)
+        conns[SQLITE_DB_PATH] = conn
+    if SQLITE_DB_PATH not in _INDEXED_DBS:
+        try:
+            ensure_indexes(conn)
+            conn.commit()
+        except sqlite3.OperationalError:
+            # Schema not created yet; init_sqlite_db() will add the index
+            pass
+    return conn
+
+# One SQL text for every audit insert, so each connection parses it once
+# and then reuses it from its statement cache
+AUDIT_INSERT_SQL = "INSERT INTO audit_log (timestamp, user, action, details) VALUES (?, ?, ?, ?)"
 
 def log_audit_event(action: str, details: str, user: str = "system"):
     """Log an audit event."""
@@ -608,15 +762,26 @@ def log_audit_event(action: str, details: str, user: str = "system"):
         conn = get_db_connection()
         cursor = conn.cursor()
         timestamp = datetime.utcnow().isoformat()
-        cursor.execute(
-            "INSERT INTO audit_log (timestamp, user, action, details) VALUES (?, ?, ?, ?)",
-            (timestamp, user, action, details)
-        )
+        cursor.execute(AUDIT_INSERT_SQL, (timestamp, user, action, details))
         conn.commit()
         conn.close()
     except Exception as e:
         print(f"Warning: Failed to log audit event: {e}", file=sys.stderr)
 
+def log_audit_events_bulk(events: List[Tuple[str, str, str]]):
+    """Log many (action, details, user) audit events in one transaction."""
+    try:
+        conn = get_db_connection()
+        timestamp = datetime.utcnow().isoformat()
+        with conn:
+            conn.executemany(
+                AUDIT_INSERT_SQL,
+                ((timestamp, user, action, details) for action, details, user in events)
+            )
+        conn.close()
+    except Exception as e:
+        print(f"Warning: Failed to log audit events: {e}", file=sys.stderr)
+
 def use_sqlite() -> bool:
     """Check if SQLite database exists and should be used."""
     return os.path.exists(SQLITE_DB_PATH)
@@ -632,27 +797,75 @@ def read_manual_file(path: str) -> str:
 # Embeddings
 # -----------------------------------------
 def embed_texts(texts: List[str]) -> List[List[float]]:
-    if client is None:
-        raise RuntimeError("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
-    resp = client.embeddings.create(model=EMBED_MODEL, input=texts)
+    resp = get_client().embeddings.create(model=EMBED_MODEL, input=texts)
     return [d.embedding for d in resp.data]
 
+def text_key(text: str) -> str:
+    """Stable dedup key for chunk text (BLAKE2b, 128-bit)."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
 # -----------------------------------------
 # Cosine similarity
 # -----------------------------------------
 def vnorm(v):
-    return math.sqrt(sum(x*x for x in v))
+    return float(np.linalg.norm(v))
 
 def cosine(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
     na, nb = vnorm(a), vnorm(b)
     if na == 0 or nb == 0:
         return 0.0
-    return sum(x*y for x, y in zip(a, b)) / (na * nb)
+    return float(np.dot(a, b)) / (na * nb)
+
+def cosine_many(query, vectors) -> np.ndarray:
+    """
+    Cosine similarity of one query vector against many vectors.
+    Uses a single matrix-vector product instead of a Python loop;
+    zero-norm rows score 0.0 (same as cosine()).
+    """
+    if len(vectors) == 0:
+        return np.zeros(0, dtype=np.float64)
+    q = np.asarray(query, dtype=np.float64)
+    m = np.asarray(vectors, dtype=np.float64)
+    qn = vnorm(q)
+    if qn == 0:
+        return np.zeros(m.shape[0], dtype=np.float64)
+    norms = np.linalg.norm(m, axis=1) * qn
+    dots = m @ q
+    return np.divide(dots, norms, out=np.zeros_like(dots), where=norms != 0)
+
+def cosine_topk(query, vectors, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices and cosine scores of the k rows of vectors closest to query,
+    best first. Partial selection (argpartition) instead of sorting every
+    score. Replaced by fast_sim.cosine_topk when the GUI runs with --jit.
+    """
+    sims = cosine_many(query, vectors)
+    k = min(k, len(sims))
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float64)
+    idx = np.argpartition(-sims, k - 1)[:k]
+    idx = idx[np.argsort(-sims[idx], kind="stable")]
+    return idx, sims[idx]
 
 # -----------------------------------------
 # Phase 1 Metadata Helpers
 # -----------------------------------------
 
+# ASCII translation for generate_topic_id, built once: letters lowercase,
+# digits and "_" kept, space to "_", everything else deleted
+_TOPIC_ID_TABLE = str.maketrans({
+    c: c.lower() if c.isalnum() or c == '_' else '_' if c == ' ' else None
+    for c in map(chr, range(128))
+})
+
+# Non-ASCII path, compiled once. Stdlib re on purpose: \d must stay
+# Unicode-aware, and google-re2's wrapper is slower on strings this short.
+_TOPIC_NUMBER_RE = re.compile(r'^[\d\.]+\s*')
+_TOPIC_STRIP_RE = re.compile(r'[^a-z0-9_]')
+_TOPIC_COLLAPSE_RE = re.compile(r'_+')
+
 def generate_topic_id(heading_text: str) -> str:
     """
     Generate stable topic_id from heading text.
@@ -668,20 +881,26 @@ def generate_topic_id(heading_text: str) -> str:
     if not heading_text:
         return ""
     
-    # Remove heading numbers (e.g., "1.5 ", "2.3.4 ")
-    text = re.sub(r'^[\d\.]+\s*', '', heading_text)
-    
-    # Lowercase and replace spaces with underscores
-    text = text.lower().replace(' ', '_')
-    
-    # Remove special characters, keep only alphanumeric and underscores
-    text = re.sub(r'[^a-z0-9_]', '', text)
-    
-    # Collapse multiple underscores
-    text = re.sub(r'_+', '_', text)
-    
-    # Trim underscores from ends
-    text = text.strip('_')
+    if heading_text.isascii():
+        # Fast path: one C-level translate pass, then split/join collapses
+        # and trims underscores (same result as the regex path below)
+        text = heading_text.lstrip('0123456789.').translate(_TOPIC_ID_TABLE)
+        text = '_'.join(filter(None, text.split('_')))
+    else:
+        # Remove heading numbers (e.g., "1.5 ", "2.3.4 ")
+        text = _TOPIC_NUMBER_RE.sub('', heading_text)
+        
+        # Lowercase and replace spaces with underscores
+        text = text.lower().replace(' ', '_')
+        
+        # Remove special characters, keep only alphanumeric and underscores
+        text = _TOPIC_STRIP_RE.sub('', text)
+        
+        # Collapse multiple underscores
+        text = _TOPIC_COLLAPSE_RE.sub('_', text)
+        
+        # Trim underscores from ends
+        text = text.strip('_')
     
     # Limit length
     if len(text) > 100:
@@ -689,6 +908,48 @@ def generate_topic_id(heading_text: str) -> str:
     
     return text
 
+# Keyword groups in precedence order: the first group with any keyword in
+# the text wins, wherever in the text that keyword occurs.
+_DOC_TYPE_PRIORITY = ["client_spec", "legislation", "standard", "guidance", "manual"]
+
+def _build_keyword_automaton(groups):
+    """
+    One Aho-Corasick automaton over every keyword in groups, a list of
+    (tag, keywords) in precedence order. Each keyword maps to the rank of
+    the first group that lists it. Returns None without pyahocorasick.
+    """
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for rank, (_, keywords) in enumerate(groups):
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if keyword not in automaton:
+                automaton.add_word(keyword, rank)
+    automaton.make_automaton()
+    return automaton
+
+def _first_keyword_tag(text, groups, automaton):
+    """Tag of the highest-precedence group with a keyword in text (lowercased), or None."""
+    if automaton is not None:
+        # One pass over text; every match is reported, so take the best rank
+        rank = min((r for _, r in automaton.iter(text)), default=None)
+        return None if rank is None else groups[rank][0]
+    for tag, keywords in groups:
+        for keyword in keywords:
+            if keyword.lower() in text:
+                return tag
+    return None
+
+_EMERGENCY_GROUPS = list(TAGGING_RULESET["emergencies"].items())
+_EMERGENCY_AUTOMATON = _build_keyword_automaton(_EMERGENCY_GROUPS)
+_DOC_TYPE_GROUPS = [
+    (doc_type, TAGGING_RULESET["document_types"][doc_type])
+    for doc_type in _DOC_TYPE_PRIORITY
+    if doc_type in TAGGING_RULESET["document_types"]
+]
+_DOC_TYPE_AUTOMATON = _build_keyword_automaton(_DOC_TYPE_GROUPS)
+
 def detect_emergency_procedure(text: str, heading: str = "") -> Tuple[bool, Optional[str]]:
     """
     Detect if text/heading indicates an emergency procedure.
@@ -697,37 +958,60 @@ def detect_emergency_procedure(text: str, heading: str = "") -> Tuple[bool, Opti
     """
     combined = (heading + " " + text[:500]).lower()
     
-    # Check emergency categories from TAGGING_RULESET
-    for category, keywords in TAGGING_RULESET["emergencies"].items():
-        for keyword in keywords:
-            if keyword.lower() in combined:
-                return (True, category)
+    # Emergency categories from TAGGING_RULESET, first category wins
+    category = _first_keyword_tag(combined, _EMERGENCY_GROUPS, _EMERGENCY_AUTOMATON)
+    if category is not None:
+        return (True, category)
     
     return (False, None)
 
+# All unit patterns as one regex, compiled once: a single finditer pass per
+# text instead of one scan per unit pattern. The number prefix every
+# pattern shares is matched once, then the unit alternatives; each unit
+# alternative ends with its own group, so match.lastindex identifies it.
+_UNIT_NUMBER_PREFIX = r"(\d+(?:\.\d+)?)\s*"
+
+def _build_unit_regex():
+    parts = []
+    by_lastindex = {}
+    group = 1
+    for order, (pattern, unit_name) in enumerate(TAGGING_RULESET["unit_patterns"].items()):
+        if not pattern.startswith(_UNIT_NUMBER_PREFIX):
+            raise ValueError(f"unit pattern must start with {_UNIT_NUMBER_PREFIX!r}: {pattern!r}")
+        suffix = pattern[len(_UNIT_NUMBER_PREFIX):]
+        group += re.compile(suffix).groups
+        by_lastindex[group] = (order, unit_name)
+        parts.append(f"(?:{suffix})")
+    combined = _UNIT_NUMBER_PREFIX + "(?:" + "|".join(parts) + ")"
+    if regex is not None:
+        # V0: re-compatible semantics, so results do not depend on which is installed
+        return regex.compile(combined, regex.IGNORECASE | regex.V0), by_lastindex
+    return re.compile(combined, re.IGNORECASE), by_lastindex
+
+_UNIT_RE, _UNIT_GROUPS = _build_unit_regex()
+
 def extract_units(text: str) -> List[Dict[str, str]]:
     """
     Extract units from text using regex patterns from TAGGING_RULESET.
-    Returns list of dicts with 'value', 'unit', and 'context'.
-    """
-    units = []
-    
-    for pattern, unit_name in TAGGING_RULESET["unit_patterns"].items():
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            value = match.group(1)
-            # Get context (20 chars before and after)
-            start = max(0, match.start() - 20)
-            end = min(len(text), match.end() + 20)
-            context = text[start:end].strip()
-            
-            units.append({
-                'value': value,
-                'unit': unit_name,
-                'context': context
-            })
+    Returns list of dicts with 'value', 'unit', and 'context',
+    grouped in unit_patterns order, then by position.
+    """
+    buckets: Dict[int, List[Dict[str, str]]] = {}
+    
+    for match in _UNIT_RE.finditer(text):
+        order, unit_name = _UNIT_GROUPS[match.lastindex]
+        # Get context (20 chars before and after)
+        start = max(0, match.start() - 20)
+        end = min(len(text), match.end() + 20)
+        context = text[start:end].strip()
+        
+        buckets.setdefault(order, []).append({
+            'value': match.group(1),
+            'unit': unit_name,
+            'context': context
+        })
     
-    return units
+    return [u for order in sorted(buckets) for u in buckets[order]]
 
 def detect_doc_type(filename: str, text: str = "") -> str:
     """
@@ -742,13 +1026,9 @@ def detect_doc_type(filename: str, text: str = "") -> str:
     
     # Check document types in order of specificity (most specific first)
     # This prevents generic keywords from matching too early
-    priority_order = ["client_spec", "legislation", "standard", "guidance", "manual"]
-    
-    for doc_type in priority_order:
-        if doc_type in TAGGING_RULESET["document_types"]:
-            for keyword in TAGGING_RULESET["document_types"][doc_type]:
-                if keyword.lower() in combined:
-                    return doc_type
+    doc_type = _first_keyword_tag(combined, _DOC_TYPE_GROUPS, _DOC_TYPE_AUTOMATON)
+    if doc_type is not None:
+        return doc_type
     
     # Default
     return 'manual'
@@ -1571,6 +1851,21 @@ def chunk_records(text: str, max_chars: int = 1400, use_hierarchy: bool = True)
 # -----------------------------------------
 # Delete / export / list / show
 # -----------------------------------------
+def delete_manual_sqlite(manual_id: str) -> int:
+    """Delete a manual's document, chunk and chunk_units rows; returns chunks removed."""
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute(
+                "DELETE FROM chunk_units WHERE chunk_id IN (SELECT id FROM chunks WHERE manual_id = ?)",
+                (manual_id,)
+            )
+            removed = conn.execute("DELETE FROM chunks WHERE manual_id = ?", (manual_id,)).rowcount
+            conn.execute("DELETE FROM documents WHERE manual_id = ?", (manual_id,))
+    finally:
+        conn.close()
+    return removed
+
 def delete_manual(manual_id: str, delete_file: bool = False) -> None:
     db = load_db()
     chunks = db.get("chunks", [])
@@ -1579,15 +1874,22 @@ def delete_manual(manual_id: str, delete_file: bool = False) -> None:
     remaining = [c for c in chunks if c["manual_id"] != manual_id]
     removed = before - len(remaining)
 
-    if removed == 0:
+    # Keep SQLite in step with db.json; it backs listings and metadata
+    sqlite_removed = delete_manual_sqlite(manual_id) if use_sqlite() else 0
+
+    if removed == 0 and sqlite_removed == 0:
         print(f"No chunks found for manual_id='{manual_id}'. Nothing deleted.")
         return
 
-    db["chunks"] = remaining
-    save_db(db)
+    if removed:
+        db["chunks"] = remaining
+        save_db(db)
 
     print(f"Removed {removed} chunks for manual_id='{manual_id}'.")
     print(f"DB now has {len(remaining)} chunks total.")
+    if sqlite_removed:
+        print(f"Removed {sqlite_removed} chunks from SQLite.")
+        log_audit_event("delete_manual", f"Deleted {manual_id}")
 
     if delete_file:
         candidates = [
@@ -1658,12 +1960,31 @@ def show_chunk(chunk_id: str) -> None:
 # -----------------------------------------
 # INGEST (Phase 1 Enhanced)
 # -----------------------------------------
-def ingest(use_hierarchy: bool = True, max_chars: int = 1400, doc_type: Optional[str] = None):
+CHUNK_INSERT_SQL = '''
+    INSERT INTO chunks
+    (id, manual_id, text, heading, path, heading_num, level,
+     topic_id, is_emergency_procedure, emergency_category, units,
+     diving_modes, physiology_tags, systems_tags,
+     normative_language, conflict_qualifiers)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+CHUNK_UNITS_INSERT_SQL = "INSERT INTO chunk_units (chunk_id, unit, value) VALUES (?, ?, ?)"
+
+
+def unit_rows(chunk_id: str, units: List[Dict[str, str]]) -> List[tuple]:
+    """chunk_units rows for the units extracted from one chunk."""
+    return [(chunk_id, u.get("unit"), u.get("value")) for u in units if isinstance(u, dict)]
+
+def ingest(use_hierarchy: bool = True, max_chars: int = 1400, doc_type: Optional[str] = None,
+           batch_size: int = 1000):
     """
     Ingest manuals with enhanced metadata support.
     Phase-1 clean behavior:
       • Manual-scoped chunk IDs
       • Re-ingest replaces previous version cleanly
+      • Each manual is written in one SQLite transaction; chunk rows are
+        flushed with executemany every `batch_size` rows
     """
 
     ensure_dirs()
@@ -1687,107 +2008,142 @@ def ingest(use_hierarchy: bool = True, max_chars: int = 1400, doc_type: Optional
     for f in files:
         print(" •", f)
 
+    batch_size = max(1, int(batch_size))
+    if use_sqlite_db:
+        # Autocommit mode; transactions are opened explicitly per manual
+        conn = get_db_connection()
+        conn.isolation_level = None
+
     all_embeddings = []
     all_chunk_ids = []
 
-    for fname in files:
-        manual_id = os.path.splitext(fname)[0]
-        path = os.path.join(MANUALS_DIR, fname)
-
-        text = read_manual_file(path)
-        detected_doc_type = doc_type or detect_doc_type(fname, text)
-        text = clean_text_for_chunking(text)
-
-        records = chunk_records(text, max_chars=max_chars, use_hierarchy=use_hierarchy)
-        records = drop_bad_records(records)
-
-        print(f"[{manual_id}] → {len(records)} chunks (doc_type: {detected_doc_type})")
+    # Identical chunk texts (repeated notices, boilerplate) are sent to the
+    # embeddings API once: text_key -> embedding. Every chunk still stores
+    # its own copy, since ask/gap/FAISS read chunk embeddings directly.
+    seen: set = set()
+    seen_embs: Dict[str, List[float]] = {}
+    dup_count = 0
 
-        # -----------------------------
-        # RE-INGEST BEHAVIOR (SAFE)
-        # -----------------------------
-        if use_sqlite_db:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM chunks WHERE manual_id = ?", (manual_id,))
-            conn.commit()
-            conn.close()
+    # The finally restores the thread's cached connection (transaction
+    # mode included) even if reading or chunking a file raises
+    try:
+        for fname in files:
+            manual_id = os.path.splitext(fname)[0]
+            path = os.path.join(MANUALS_DIR, fname)
+
+            text = read_manual_file(path)
+            detected_doc_type = doc_type or detect_doc_type(fname, text)
+            text = clean_text_for_chunking(text)
+
+            records = chunk_records(text, max_chars=max_chars, use_hierarchy=use_hierarchy)
+            records = drop_bad_records(records)
+
+            print(f"[{manual_id}] → {len(records)} chunks (doc_type: {detected_doc_type})")
+
+            # -----------------------------
+            # RE-INGEST BEHAVIOR (SAFE)
+            # One transaction per manual: old chunks are only replaced
+            # if the whole manual embeds and inserts successfully.
+            # -----------------------------
+            if use_sqlite_db:
+                conn.execute("BEGIN")
+                conn.execute(
+                    "DELETE FROM chunk_units WHERE chunk_id IN (SELECT id FROM chunks WHERE manual_id = ?)",
+                    (manual_id,)
+                )
+                conn.execute("DELETE FROM chunks WHERE manual_id = ?", (manual_id,))
+                conn.execute(
+                    '''
+                    INSERT OR REPLACE INTO documents
+                    (manual_id, doc_type, file_path, ingested_at)
+                    VALUES (?, ?, ?, ?)
+                    ''',
+                    (manual_id, detected_doc_type, path, datetime.utcnow().isoformat())
+                )
 
-        # Manual-scoped chunk counter
-        local_cid = 0
+            # Manual-scoped chunk counter
+            local_cid = 0
+            chunk_rows: List[tuple] = []
+            units_rows: List[tuple] = []
+
+            try:
+                embed_batch = 16
+                for i in range(0, len(records), embed_batch):
+                    subrecs = records[i:i + embed_batch]
+                    keys = [text_key(r["text"]) for r in subrecs]
+
+                    # Only send texts we have not embedded yet
+                    pending: Dict[str, str] = {}
+                    for key, r in zip(keys, subrecs):
+                        if key not in seen_embs and key not in pending:
+                            pending[key] = r["text"]
+                    if pending:
+                        embs = embed_texts(list(pending.values()))
+                        seen_embs.update(zip(pending.keys(), embs))
+
+                    for r, key in zip(subrecs, keys):
+                        chunk_id = f"{manual_id}::C{local_cid}"
+                        emb = seen_embs[key]
+                        if key in seen:
+                            dup_count += 1
+                        else:
+                            seen.add(key)
+
+                        if use_sqlite_db:
+                            chunk_rows.append((
+                                chunk_id,
+                                manual_id,
+                                r["text"],
+                                r.get("heading", ""),
+                                r.get("path", ""),
+                                r.get("heading_num", ""),
+                                r.get("level", 0),
+                                r.get("topic_id", ""),
+                                1 if r.get("is_emergency_procedure") else 0,
+                                r.get("emergency_category"),
+                                json.dumps(r.get("units", [])),
+                                json.dumps(r.get("diving_modes", [])),
+                                json.dumps(r.get("physiology_tags", [])),
+                                json.dumps(r.get("systems_tags", [])),
+                                r.get("normative_language"),
+                                json.dumps(r.get("conflict_qualifiers", [])),
+                            ))
+                            units_rows.extend(unit_rows(chunk_id, r.get("units", [])))
+                            if len(chunk_rows) >= batch_size:
+                                conn.executemany(CHUNK_INSERT_SQL, chunk_rows)
+                                conn.executemany(CHUNK_UNITS_INSERT_SQL, units_rows)
+                                chunk_rows = []
+                                units_rows = []
+
+                        rec = {
+                            "id": chunk_id,
+                            "manual_id": manual_id,
+                            "text": r["text"],
+                            "embedding": emb,
+                            "heading": r.get("heading", ""),
+                            "path": r.get("path", ""),
+                        }
+                        db["chunks"].append(rec)
+
+                        all_embeddings.append(emb)
+                        all_chunk_ids.append(chunk_id)
+
+                        local_cid += 1
 
-        # Store document metadata
+                if use_sqlite_db:
+                    if chunk_rows:
+                        conn.executemany(CHUNK_INSERT_SQL, chunk_rows)
+                        conn.executemany(CHUNK_UNITS_INSERT_SQL, units_rows)
+                    conn.execute("COMMIT")
+            except BaseException:
+                if use_sqlite_db:
+                    conn.execute("ROLLBACK")
+                raise
+    finally:
         if use_sqlite_db:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                '''
-                INSERT OR REPLACE INTO documents
-                (manual_id, doc_type, file_path, ingested_at)
-                VALUES (?, ?, ?, ?)
-                ''',
-                (manual_id, detected_doc_type, path, datetime.utcnow().isoformat())
-            )
-            conn.commit()
             conn.close()
 
-        batch_size = 16
-        for i in range(0, len(records), batch_size):
-            subrecs = records[i:i + batch_size]
-            subtexts = [r["text"] for r in subrecs]
-            embs = embed_texts(subtexts)
-
-            for r, emb in zip(subrecs, embs):
-                chunk_id = f"{manual_id}::C{local_cid}"
-
-                if use_sqlite_db:
-                    conn = get_db_connection()
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        '''
-                        INSERT INTO chunks
-                        (id, manual_id, text, heading, path, heading_num, level,
-                         topic_id, is_emergency_procedure, emergency_category, units,
-                         diving_modes, physiology_tags, systems_tags,
-                         normative_language, conflict_qualifiers)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''',
-                        (
-                            chunk_id,
-                            manual_id,
-                            r["text"],
-                            r.get("heading", ""),
-                            r.get("path", ""),
-                            r.get("heading_num", ""),
-                            r.get("level", 0),
-                            r.get("topic_id", ""),
-                            1 if r.get("is_emergency_procedure") else 0,
-                            r.get("emergency_category"),
-                            json.dumps(r.get("units", [])),
-                            json.dumps(r.get("diving_modes", [])),
-                            json.dumps(r.get("physiology_tags", [])),
-                            json.dumps(r.get("systems_tags", [])),
-                            r.get("normative_language"),
-                            json.dumps(r.get("conflict_qualifiers", [])),
-                        )
-                    )
-                    conn.commit()
-                    conn.close()
-
-                db["chunks"].append({
-                    "id": chunk_id,
-                    "manual_id": manual_id,
-                    "text": r["text"],
-                    "embedding": emb,
-                    "heading": r.get("heading", ""),
-                    "path": r.get("path", ""),
-                })
-
-                all_embeddings.append(emb)
-                all_chunk_ids.append(chunk_id)
-
-                local_cid += 1
-
+    faiss = get_faiss()
     if faiss and all_embeddings:
         print("Building FAISS index...")
         embeddings_array = np.array(all_embeddings, dtype="float32")
@@ -1796,35 +2152,40 @@ def ingest(use_hierarchy: bool = True, max_chars: int = 1400, doc_type: Optional
         index.add(embeddings_array)
         faiss.write_index(index, FAISS_INDEX_PATH)
         with open(FAISS_INDEX_PATH + ".ids", "w") as f:
-            json.dump(all_chunk_ids, f)
+            json.dump({"dtype": "float32", "ids": all_chunk_ids}, f)
 
     save_db(db)
     print(f"\nIngestion complete. Total chunks: {len(db['chunks'])}")
+    if dup_count:
+        print(f"Reused embeddings for {dup_count} duplicate chunks.")
 
 
 
 # ============================================================
 # ASK (Q&A retrieval)
 # ============================================================
-def ask(question: str, include: List[str] = None, top_k: int = 12):
+def ask(question: str, include: List[str] = None, top_k: int = 12, q_emb=None,
+        echo: bool = True) -> Optional[str]:
+    """
+    Answer question from the top_k most similar chunks. q_emb may be a
+    precomputed question embedding. Returns the answer report (printed
+    too unless echo is False), or None if the DB is empty.
+    """
     db = load_db()
     chunks = db.get("chunks", [])
     if not chunks:
-        print("DB empty. Run: python manual_core.py ingest")
-        return
+        if echo:
+            print("DB empty. Run: python manual_core.py ingest")
+        return None
 
     include = include or []
-    q_emb = embed_texts([question])[0]
-
-    scored = []
-    for r in chunks:
-        if include and not any(x.lower() in r["manual_id"].lower() for x in include):
-            continue
-        sim = cosine(q_emb, r["embedding"])
-        scored.append((sim, r))
+    if q_emb is None:
+        q_emb = embed_texts([question])[0]
 
-    scored.sort(reverse=True, key=lambda x: x[0])
-    top = scored[:top_k]
+    if include:
+        chunks = [r for r in chunks if any(x.lower() in r["manual_id"].lower() for x in include)]
+    idx, sims = cosine_topk(q_emb, [r["embedding"] for r in chunks], top_k)
+    top = [(float(sim), chunks[i]) for i, sim in zip(idx, sims)]
 
     context = ""
     for i, (sim, r) in enumerate(top, 1):
@@ -1845,22 +2206,20 @@ def ask(question: str, include: List[str] = None, top_k: int = 12):
     )
     user = f"QUESTION:\n{question}\n\nSOURCES:\n{context}\n\nAnswer strictly from sources."
 
-    if client is None:
-        raise RuntimeError("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
-    
-    resp = client.chat.completions.create(
+    resp = get_client().chat.completions.create(
         model=CHAT_MODEL,
         messages=[{"role": "system", "content": system},
                   {"role": "user", "content": user}],
         temperature=0.1
     )
 
-    print("\n===== ANSWER =====\n")
-    print(resp.choices[0].message.content)
-
-    print("\n===== SOURCES USED =====\n")
-    for i, (sim, r) in enumerate(top, 1):
-        print(f"{i}. {r['manual_id']} | {r['id']} | sim={sim:.3f}")
+    lines = ["\n===== ANSWER =====\n", resp.choices[0].message.content,
+             "\n===== SOURCES USED =====\n"]
+    lines += [f"{i}. {r['manual_id']} | {r['id']} | sim={sim:.3f}" for i, (sim, r) in enumerate(top, 1)]
+    report = "\n".join(lines) + "\n"
+    if echo:
+        print(report, end="")
+    return report
 
 
 def preview_manual(manual_id: str, start_index: int = 0, limit: int = 10) -> None:
@@ -1912,10 +2271,7 @@ def analyze_gap(std_text: str, manual_context: str, standard_id: str, manual_id:
         "4. State which manual sources were used.\n"
     )
 
-    if client is None:
-        raise RuntimeError("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
-    
-    resp = client.chat.completions.create(
+    resp = get_client().chat.completions.create(
         model=CHAT_MODEL,
         messages=[{"role": "system", "content": system},
                   {"role": "user", "content": user}],
@@ -1940,16 +2296,55 @@ def gap(standard_id: str, manual_id: str, start_index=0, max_clauses=10,
         print("No manual chunks found.")
         return
 
-    std_chunks = std_chunks[start_index:start_index + max_clauses]
+    # Stack manual embeddings once; each clause is then one matrix-vector product
+    man_matrix = np.asarray([m["embedding"] for m in man_chunks], dtype=np.float64)
+
+    _gap_clauses(std_chunks[start_index:start_index + max_clauses], man_chunks, man_matrix,
+                 standard_id, manual_id, top_n, min_sim, out_csv, out_html)
+
+
+def gap_batch(standard_ids: List[str], manual_id: str, start_index=0, max_clauses=10,
+              top_n=5, min_sim=0.40, out_csv=None, out_html=None):
+    """
+    Run gap() for several standards against one manual. The DB is loaded
+    and the manual's embeddings stacked once for the whole batch.
+    out_csv/out_html may contain "{standard_id}", filled in per standard.
+    """
+    db = load_db()
+    by_manual: Dict[str, List[Dict[str, Any]]] = {}
+    for c in db.get("chunks", []):
+        by_manual.setdefault(c["manual_id"], []).append(c)
+
+    man_chunks = by_manual.get(manual_id, [])
+    if not man_chunks:
+        print("No manual chunks found.")
+        return
+    man_matrix = np.asarray([m["embedding"] for m in man_chunks], dtype=np.float64)
+
+    for standard_id in standard_ids:
+        print("\n" + "#"*72)
+        print(f"STANDARD {standard_id} vs {manual_id}")
+        print("#"*72)
+        std_chunks = by_manual.get(standard_id)
+        if not std_chunks:
+            print("No standard chunks found.")
+            continue
+        _gap_clauses(
+            std_chunks[start_index:start_index + max_clauses], man_chunks, man_matrix,
+            standard_id, manual_id, top_n, min_sim,
+            out_csv.replace("{standard_id}", standard_id) if out_csv else None,
+            out_html.replace("{standard_id}", standard_id) if out_html else None,
+        )
+
+
+def _gap_clauses(std_chunks, man_chunks, man_matrix, standard_id, manual_id,
+                 top_n, min_sim, out_csv, out_html):
+    """Score, classify and report the given standard clauses against one manual."""
     results = []
 
     for idx, std in enumerate(std_chunks, 1):
-        scored = []
-        for m in man_chunks:
-            sim = cosine(std["embedding"], m["embedding"])
-            scored.append((sim, m))
-        scored.sort(reverse=True, key=lambda x: x[0])
-        top = scored[:top_n]
+        top_idx, sims = cosine_topk(std["embedding"], man_matrix, top_n)
+        top = [(float(sim), man_chunks[i]) for i, sim in zip(top_idx, sims)]
         best_sim = top[0][0] if top else 0
 
         print("\n" + "="*72)
@@ -2512,7 +2907,9 @@ def main():
     parser = argparse.ArgumentParser(description="Small, boring Q&A engine over local manuals.")
     sub = parser.add_subparsers(dest="command", required=True)
 
-    sub.add_parser("ingest", help="Ingest all manuals/*.txt,*.md into the local DB.")
+    ingest_p = sub.add_parser("ingest", help="Ingest all manuals/*.txt,*.md into the local DB.")
+    ingest_p.add_argument("--batch-size", type=int, default=1000,
+                          help="Chunk rows per SQLite executemany batch")
     sub.add_parser("list", help="List ingested manuals and chunk counts.")
 
     show_p = sub.add_parser("show", help="Show a specific chunk's text.")
@@ -2594,7 +2991,7 @@ def main():
     args = parser.parse_args()
 
     if args.command == "ingest":
-        ingest(use_hierarchy=True, max_chars=1400)
+        ingest(use_hierarchy=True, max_chars=1400, batch_size=args.batch_size)
     elif args.command == "list":
         list_manuals()
     elif args.command == "show":
@@ -6,23 +6,129 @@
 
 import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog, messagebox
+import sqlite3
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import os
+from collections import Counter, OrderedDict
 import sys
 import subprocess
 import platform
+import argparse
 from typing import Optional, List, Tuple
 
-# Import core functionality
+# Import core functionality (manual_core defers its own slow imports,
+# OpenAI and FAISS, to first use)
 from manual_core import (
-    ingest, list_manuals, ask, gap, delete_manual, export_manual,
-    preview_manual, show_chunk, load_db, ensure_dirs, MANUALS_DIR,
-    use_sqlite, get_db_connection
+    load_db, ensure_dirs, MANUALS_DIR, use_sqlite, get_db_connection,
+    ensure_indexes, cosine_many, ingest, ask, embed_texts, gap_batch,
+    delete_manual, export_manual
 )
 
 
 STANDARD_TYPES = {"standard", "legislation", "guidance", "client_spec"}
 
+# Docs + chunk counts (per-document subquery hits idx_chunks_manual_id,
+# so docs with 0 chunks still show without aggregating all of chunks).
+# Kept as one constant so the connection's statement cache reuses the
+# compiled statement on every refresh.
+DOCS_QUERY_SQL = """
+    SELECT
+        d.manual_id,
+        COALESCE(NULLIF(d.doc_type, ''), 'manual') AS doc_type,
+        (SELECT COUNT(*) FROM chunks c WHERE c.manual_id = d.manual_id) AS chunk_count
+    FROM documents d
+    ORDER BY d.manual_id COLLATE NOCASE
+"""
+
+# Period of the main-loop pump that applies queued worker output/UI calls
+FLUSH_INTERVAL_MS = 50
+
+# Output widgets keep only the most recent lines (Tk line indexing is O(lines));
+# the full text stays available through "Save Log"
+MAX_OUTPUT_LINES = 5000
+
+
+def trim_text_widget(widget, max_lines: int = MAX_OUTPUT_LINES):
+    """Drop lines from the head of a Text widget beyond max_lines."""
+    count = int(widget.index("end-1c").split(".")[0])
+    if count > max_lines:
+        widget.delete("1.0", f"{count - max_lines + 1}.0")
+
+
+class RedirectText:
+    """
+    File-like stdout target for a Tk Text widget.
+    write() may be called from worker threads and never touches Tk: it
+    only queues (widget, string); ManualGUI._pump inserts it on the main
+    loop.
+    """
+
+    def __init__(self, text_widget, output_queue: "queue.Queue"):
+        self.text_widget = text_widget
+        self._queue = output_queue
+
+    def write(self, string):
+        if string:
+            self._queue.put((self.text_widget, string))
+
+    def flush(self):
+        pass
+
+
+class AskCache:
+    """
+    Answers printed by ask(), reused for repeated questions.
+    Exact hits match the normalized (question, include, top_k) key; otherwise
+    a question whose embedding has cosine >= threshold with a cached one
+    (same include/top_k) reuses its answer. Least recently used entries are
+    evicted beyond maxsize. Thread-safe.
+    """
+
+    def __init__(self, maxsize: int = 256, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(question: str, include: Optional[List[str]], top_k: int) -> tuple:
+        scope = tuple(sorted(x.lower() for x in include or []))
+        return (" ".join(question.lower().split()), scope, top_k)
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def get_similar(self, key: tuple, q_emb) -> Optional[str]:
+        with self._lock:
+            candidates = [(k, emb) for k, (emb, _) in self._entries.items() if k[1:] == key[1:]]
+            if not candidates:
+                return None
+            sims = cosine_many(q_emb, [emb for _, emb in candidates])
+            best = int(sims.argmax())
+            if sims[best] < self.threshold:
+                return None
+            hit = candidates[best][0]
+            self._entries.move_to_end(hit)
+            return self._entries[hit][1]
+
+    def put(self, key: tuple, q_emb, output: str):
+        with self._lock:
+            self._entries[key] = (q_emb, output)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
 
 class ManualGUI:
     def __init__(self, root):
@@ -30,6 +136,47 @@ class ManualGUI:
         self.root.title("Manual Intelligence Engine")
         self.root.geometry("1000x700")
 
+        # Bounded worker pool for run_in_thread (reuses threads, caps concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mgui")
+        # Submitted tasks not yet finished, so close can cancel queued ones
+        self._futures = set()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+
+        # Workers never touch Tk: stdout text and UI callbacks are queued
+        # here and applied by _pump on the main loop
+        self.output_queue: "queue.Queue" = queue.Queue()
+        self._ui_calls: "queue.Queue" = queue.Queue()
+        self._redirectors = {}
+        # Everything written to each output widget since it was last cleared
+        self._full_logs = {}
+
+        # Persistent SQLite connection for GUI reads (see _get_conn)
+        self._conn = None
+        self._cur = None
+        self._conn_lock = threading.Lock()
+
+        # Pending root.after id for a debounced refresh_gap_ids
+        self._pending_refresh = None
+        # Last values written to the gap-tab comboboxes
+        self._last_standards: Optional[Tuple[str, ...]] = None
+        self._last_manuals: Optional[Tuple[str, ...]] = None
+
+        # Answers for repeated/paraphrased questions; cleared on ingest/delete
+        self._ask_cache = AskCache()
+
+        # Cached document list, invalidated via PRAGMA data_version
+        self._docs_cache: Optional[List[Tuple[str, str, int]]] = None
+        self._docs_data_version: Optional[int] = None
+
+        # Resolved once: used by the ingest tab label and open_manuals_folder
+        self._manuals_abs = os.path.abspath(MANUALS_DIR)
+        self._platform = platform.system()
+        if self._platform == "Windows":
+            self._opener = os.startfile
+        else:
+            cmd = "open" if self._platform == "Darwin" else "xdg-open"
+            self._opener = lambda p: subprocess.Popen([cmd, p])
+
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -43,38 +190,77 @@ class ManualGUI:
 
         ensure_dirs()
 
+        # The one output/UI-call pump loop; it reschedules itself
+        self._pump()
+
         # Populate dropdowns on startup
-        self.refresh_gap_ids()
+        self._schedule_refresh_gap_ids()
 
     # -----------------------------
     # Helpers: SQLite doc listing
     # -----------------------------
+    def _get_conn(self):
+        """
+        Lazily open the GUI's shared SQLite connection.
+        Callers must hold self._conn_lock; worker threads use it too,
+        hence check_same_thread=False.
+        """
+        if self._conn is None:
+            conn = get_db_connection(check_same_thread=False)
+            conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                PRAGMA cache_size=-65536;
+            """)
+            self._ensure_indexes(conn)
+            self._conn = conn
+            self._cur = conn.cursor()
+        return self._conn
+
+    def _ensure_indexes(self, conn):
+        """
+        Make sure chunks(manual_id) is indexed and the planner has stats for it,
+        so the per-document COUNT(*) in DOCS_QUERY_SQL is answered from the
+        index alone. Runs once per connection.
+        """
+        try:
+            ensure_indexes(conn)
+            conn.execute("ANALYZE chunks")
+            conn.commit()
+        except sqlite3.OperationalError:
+            # Schema not initialised yet (no ingest run); nothing to index
+            pass
+
     def fetch_docs_from_sqlite(self) -> List[Tuple[str, str, int]]:
         """
         Returns list of (manual_id, doc_type, chunk_count)
         Requires SQLite DB to exist.
+        Result is cached until another connection writes to the DB
+        (PRAGMA data_version changes) or invalidate_docs_cache() is called.
         """
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        # Pull docs + chunk counts (LEFT JOIN so docs with 0 chunks still show)
-        cur.execute("""
-            SELECT
-                d.manual_id,
-                COALESCE(d.doc_type, 'manual') AS doc_type,
-                COUNT(c.id) AS chunk_count
-            FROM documents d
-            LEFT JOIN chunks c ON c.manual_id = d.manual_id
-            GROUP BY d.manual_id, d.doc_type
-            ORDER BY d.manual_id COLLATE NOCASE
-        """)
-        rows = cur.fetchall()
-        conn.close()
-
-        out = []
-        for manual_id, doc_type, chunk_count in rows:
-            out.append((manual_id, (doc_type or "manual"), int(chunk_count or 0)))
-        return out
+        with self._conn_lock:
+            self._get_conn()
+            cur = self._cur
+
+            data_version = cur.execute("PRAGMA data_version").fetchone()[0]
+            if self._docs_cache is not None and data_version == self._docs_data_version:
+                return self._docs_cache
+
+            cur.execute(DOCS_QUERY_SQL)
+            # Rows already come back as (str, str, int) tuples
+            out = cur.fetchall()
+
+            self._docs_cache = out
+            self._docs_data_version = data_version
+            return out
+
+    def invalidate_docs_cache(self):
+        """Force the next fetch_docs_from_sqlite() to re-query."""
+        with self._conn_lock:
+            self._docs_cache = None
+            self._docs_data_version = None
 
     def fetch_docs_fallback_json(self) -> List[Tuple[str, str, int]]:
         """
@@ -82,39 +268,79 @@ class ManualGUI:
         """
         db = load_db()
         chunks = db.get("chunks", [])
-        counts = {}
-        for c in chunks:
-            mid = c.get("manual_id", "")
-            if not mid:
-                continue
-            counts[mid] = counts.get(mid, 0) + 1
-        return [(mid, "manual", counts[mid]) for mid in sorted(counts.keys(), key=str.lower)]
+        counts = Counter(mid for mid in (c.get("manual_id") for c in chunks) if mid)
+        return [(mid, "manual", n) for mid, n in sorted(counts.items(), key=lambda kv: kv[0].lower())]
+
+    def _schedule_refresh_gap_ids(self, delay_ms: int = 150):
+        """
+        Debounced refresh_gap_ids: a burst of requests within delay_ms
+        collapses into a single query + combobox update.
+        """
+        if self._pending_refresh is not None:
+            self.root.after_cancel(self._pending_refresh)
+        self._pending_refresh = self.root.after(delay_ms, self._do_refresh_gap_ids_now)
+
+    def _do_refresh_gap_ids_now(self):
+        self._pending_refresh = None
+        self.refresh_gap_ids()
 
     def refresh_gap_ids(self):
         """
         Refresh the combobox lists for Standard ID and Manual ID.
-        Standards are doc_type in STANDARD_TYPES; manuals are everything else.
+        The document query runs on a worker thread; only the widget
+        update is marshalled back to the Tk main thread.
         """
+        self.run_in_thread(self._fetch_docs_bg)
+
+    def _load_docs(self) -> List[Tuple[str, str, int]]:
+        """Document list from SQLite, or from db.json if SQLite is missing."""
+        if use_sqlite():
+            return self.fetch_docs_from_sqlite()
+        return self.fetch_docs_fallback_json()
+
+    def _fetch_docs_bg(self):
+        """Worker-thread half of refresh_gap_ids."""
         try:
-            if use_sqlite():
-                docs = self.fetch_docs_from_sqlite()
-            else:
-                docs = self.fetch_docs_fallback_json()
+            docs = self._load_docs()
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load document list: {e}")
+            msg = f"Failed to load document list: {e}"
+            self.call_in_ui(messagebox.showerror, "Error", msg)
             return
+        self.call_in_ui(self._apply_docs_ui, docs)
 
-        standards = [mid for (mid, dt, n) in docs if dt in STANDARD_TYPES and n > 0]
-        manuals = [mid for (mid, dt, n) in docs if dt not in STANDARD_TYPES and n > 0]
+    def _apply_docs_ui(self, docs: List[Tuple[str, str, int]]):
+        """
+        Main-thread half of refresh_gap_ids.
+        Standards are doc_type in STANDARD_TYPES; manuals are everything else.
+        """
+        standards: List[str] = []
+        manuals: List[str] = []
+        for mid, dt, n in docs:
+            if n <= 0:
+                continue
+            (standards if dt in STANDARD_TYPES else manuals).append(mid)
 
         # Allow typing, but provide dropdown options
-        self.gap_standard_combo["values"] = standards
-        self.gap_manual_combo["values"] = manuals
+        # (only touch the widgets when the lists actually changed)
+        new_standards = tuple(standards)
+        if new_standards != self._last_standards:
+            self.gap_standard_combo["values"] = new_standards
+            self._last_standards = new_standards
+        new_manuals = tuple(manuals)
+        if new_manuals != self._last_manuals:
+            self.gap_manual_combo["values"] = new_manuals
+            self._last_manuals = new_manuals
 
         # If empty/invalid current selection, clear it
-        if self.gap_standard_combo.get().strip() not in standards:
+        # (a comma-separated batch is kept if every entry is a standard)
+        standard_set = set(standards)
+        current_std = self.gap_standard_combo.get().strip()
+        if current_std not in standard_set and not all(
+            s in standard_set for s in self._parse_standard_ids(current_std)
+        ):
             self.gap_standard_combo.set("")
-        if self.gap_manual_combo.get().strip() not in manuals:
+        current_man = self.gap_manual_combo.get().strip()
+        if current_man not in set(manuals):
             self.gap_manual_combo.set("")
 
     # -----------------------------
@@ -134,13 +360,22 @@ class ManualGUI:
 
         dir_frame = ttk.Frame(frame)
         dir_frame.pack(pady=5, padx=10, fill=tk.X)
-        ttk.Label(dir_frame, text=f"Manuals Directory: {os.path.abspath(MANUALS_DIR)}").pack(side=tk.LEFT)
+        ttk.Label(dir_frame, text=f"Manuals Directory: {self._manuals_abs}").pack(side=tk.LEFT)
         ttk.Button(dir_frame, text="Open Folder", command=self.open_manuals_folder).pack(side=tk.RIGHT)
 
+        options_frame = ttk.Frame(frame)
+        options_frame.pack(pady=5, padx=10, fill=tk.X)
+        ttk.Label(options_frame, text="Batch Size:").pack(side=tk.LEFT)
+        self.ingest_batch_var = tk.StringVar(value="1000")
+        ttk.Entry(options_frame, textvariable=self.ingest_batch_var, width=10).pack(side=tk.LEFT, padx=5)
+
         ttk.Button(frame, text="Ingest Manuals", command=self.do_ingest).pack(pady=10)
 
-        ttk.Label(frame, text="Output:").pack(anchor=tk.W, padx=10)
-        self.ingest_output = scrolledtext.ScrolledText(frame, height=25, width=120)
+        header = ttk.Frame(frame)
+        header.pack(padx=10, fill=tk.X)
+        ttk.Label(header, text="Output:").pack(side=tk.LEFT)
+        ttk.Button(header, text="Save Log", command=lambda: self.save_log(self.ingest_output, "ingest_log.txt")).pack(side=tk.RIGHT)
+        self.ingest_output = scrolledtext.ScrolledText(frame, height=25, width=120, undo=False)
         self.ingest_output.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
 
     def create_ask_tab(self):
@@ -165,7 +400,7 @@ class ManualGUI:
         ttk.Button(frame, text="Ask Question", command=self.do_ask).pack(pady=10)
 
         ttk.Label(frame, text="Answer:").pack(anchor=tk.W, padx=10)
-        self.ask_output = scrolledtext.ScrolledText(frame, height=25, width=120)
+        self.ask_output = scrolledtext.ScrolledText(frame, height=25, width=120, undo=False)
         self.ask_output.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
 
     def create_gap_tab(self):
@@ -175,7 +410,7 @@ class ManualGUI:
         id_frame = ttk.Frame(frame)
         id_frame.pack(pady=10, padx=10, fill=tk.X)
 
-        ttk.Label(id_frame, text="Standard ID:").grid(row=0, column=0, sticky=tk.W, pady=2)
+        ttk.Label(id_frame, text="Standard ID(s):").grid(row=0, column=0, sticky=tk.W, pady=2)
         self.gap_standard_combo = ttk.Combobox(id_frame, width=47, state="normal")
         self.gap_standard_combo.grid(row=0, column=1, sticky=tk.W, padx=5)
 
@@ -183,7 +418,7 @@ class ManualGUI:
         self.gap_manual_combo = ttk.Combobox(id_frame, width=47, state="normal")
         self.gap_manual_combo.grid(row=1, column=1, sticky=tk.W, padx=5)
 
-        ttk.Button(id_frame, text="Refresh IDs", command=self.refresh_gap_ids).grid(row=0, column=2, rowspan=2, padx=10)
+        ttk.Button(id_frame, text="Refresh IDs", command=self._schedule_refresh_gap_ids).grid(row=0, column=2, rowspan=2, padx=10)
 
         options_frame = ttk.Frame(frame)
         options_frame.pack(pady=5, padx=10, fill=tk.X)
@@ -215,8 +450,11 @@ class ManualGUI:
 
         ttk.Button(frame, text="Run Gap Analysis", command=self.do_gap).pack(pady=10)
 
-        ttk.Label(frame, text="Results:").pack(anchor=tk.W, padx=10)
-        self.gap_output = scrolledtext.ScrolledText(frame, height=20, width=120)
+        header = ttk.Frame(frame)
+        header.pack(padx=10, fill=tk.X)
+        ttk.Label(header, text="Results:").pack(side=tk.LEFT)
+        ttk.Button(header, text="Save Log", command=lambda: self.save_log(self.gap_output, "gap_log.txt")).pack(side=tk.RIGHT)
+        self.gap_output = scrolledtext.ScrolledText(frame, height=20, width=120, undo=False)
         self.gap_output.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
 
     def create_manage_tab(self):
@@ -228,7 +466,7 @@ class ManualGUI:
 
         ttk.Button(list_frame, text="Refresh List", command=self.do_list).pack(pady=5)
 
-        self.list_output = scrolledtext.ScrolledText(list_frame, height=15, width=100)
+        self.list_output = scrolledtext.ScrolledText(list_frame, height=15, width=100, undo=False)
         self.list_output.pack(pady=5, fill=tk.BOTH, expand=True)
 
         action_frame = ttk.Frame(frame)
@@ -259,62 +497,134 @@ class ManualGUI:
     # Utilities
     # -----------------------------
     def open_manuals_folder(self):
-        path = os.path.abspath(MANUALS_DIR)
-        if platform.system() == "Windows":
-            os.startfile(path)
-        elif platform.system() == "Darwin":
-            subprocess.Popen(["open", path])
-        else:
-            subprocess.Popen(["xdg-open", path])
+        self._opener(self._manuals_abs)
 
     def run_in_thread(self, func, *args, **kwargs):
         def wrapper():
             try:
-                self.set_status("Processing...")
+                self.call_in_ui(self.set_status, "Processing...")
                 func(*args, **kwargs)
-                self.set_status("Done")
+                self.call_in_ui(self.set_status, "Done")
             except Exception as e:
-                messagebox.showerror("Error", str(e))
-                self.set_status("Error occurred")
-
-        thread = threading.Thread(target=wrapper)
-        thread.daemon = True
-        thread.start()
+                self.call_in_ui(messagebox.showerror, "Error", str(e))
+                self.call_in_ui(self.set_status, "Error occurred")
+
+        future = self._executor.submit(wrapper)
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        return future
+
+    def _on_close(self):
+        # Stop accepting work and drop tasks still queued; a task already
+        # running (e.g. an ingest transaction) finishes before exit.
+        for future in list(self._futures):
+            future.cancel()
+        try:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        except TypeError:
+            # Python 3.8: no cancel_futures (queued tasks were cancelled above)
+            self._executor.shutdown(wait=False)
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self.root.destroy()
 
     def set_status(self, text):
         self.status_bar.config(text=text)
-        self.root.update_idletasks()
 
     def redirect_output(self, widget):
-        class RedirectText:
-            def __init__(self, text_widget):
-                self.text_widget = text_widget
+        """Return the (single, reused) RedirectText registered for widget."""
+        redirector = self._redirectors.get(widget)
+        if redirector is None:
+            redirector = RedirectText(widget, self.output_queue)
+            self._redirectors[widget] = redirector
+        return redirector
+
+    def clear_output(self, widget):
+        """Empty an output widget and its saved log."""
+        widget.delete(1.0, tk.END)
+        self._full_logs.pop(widget, None)
+
+    def save_log(self, widget, default_name: str):
+        """Write the full output of widget (including trimmed lines) to a file."""
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
+            initialfile=default_name,
+        )
+        if not filename:
+            return
+        try:
+            with open(filename, "w", encoding="utf-8") as f:
+                f.writelines(self._full_logs.get(widget, []))
+        except OSError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.set_status(f"Log saved to {filename}")
 
-            def write(self, string):
-                self.text_widget.insert(tk.END, string)
-                self.text_widget.see(tk.END)
-                self.text_widget.update_idletasks()
+    def call_in_ui(self, func, *args):
+        """Thread-safe: run func(*args) on the Tk main loop at the next pump."""
+        self._ui_calls.put((func, args))
 
-            def flush(self):
-                pass
+    def _pump(self):
+        """Main thread: apply queued output and UI calls, then reschedule."""
+        pending = {}
+        while True:
+            try:
+                widget, string = self.output_queue.get_nowait()
+            except queue.Empty:
+                break
+            pending.setdefault(widget, []).append(string)
+        # One insert per widget however many writes were queued
+        for widget, parts in pending.items():
+            self._full_logs.setdefault(widget, []).extend(parts)
+            # Follow the output only if the view was already at the bottom,
+            # so a user who scrolled back is not yanked down
+            at_bottom = widget.yview()[1] > 0.98
+            widget.insert(tk.END, "".join(parts))
+            trim_text_widget(widget)
+            if at_bottom:
+                widget.see(tk.END)
+
+        while True:
+            try:
+                func, args = self._ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception:
+                # Same reporting Tk uses for failing after() callbacks
+                self.root.report_callback_exception(*sys.exc_info())
 
-        return RedirectText(widget)
+        self.root.after(FLUSH_INTERVAL_MS, self._pump)
 
     # -----------------------------
     # Actions
     # -----------------------------
     def do_ingest(self):
-        self.ingest_output.delete(1.0, tk.END)
+        try:
+            batch_size = int(self.ingest_batch_var.get())
+            if batch_size < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Batch Size must be a positive number")
+            return
+
+        self.clear_output(self.ingest_output)
 
         def ingest_task():
             old_stdout = sys.stdout
             sys.stdout = self.redirect_output(self.ingest_output)
             try:
-                ingest(use_hierarchy=True, max_chars=1400)
+                ingest(use_hierarchy=True, max_chars=1400, batch_size=batch_size)
             finally:
                 sys.stdout = old_stdout
             # After ingest, refresh dropdown IDs automatically
-            self.refresh_gap_ids()
+            self._ask_cache.clear()
+            self.invalidate_docs_cache()
+            self.call_in_ui(self._schedule_refresh_gap_ids)
 
         self.run_in_thread(ingest_task)
 
@@ -333,24 +643,44 @@ class ManualGUI:
             messagebox.showerror("Error", "Top K must be a number")
             return
 
-        self.ask_output.delete(1.0, tk.END)
+        self.clear_output(self.ask_output)
 
         def ask_task():
-            old_stdout = sys.stdout
-            sys.stdout = self.redirect_output(self.ask_output)
-            try:
-                ask(question, include=include, top_k=top_k)
-            finally:
-                sys.stdout = old_stdout
+            out = self.redirect_output(self.ask_output)
+            key = AskCache.make_key(question, include, top_k)
+            cached = self._ask_cache.get(key)
+            q_emb = None
+            if cached is None:
+                q_emb = embed_texts([question])[0]
+                cached = self._ask_cache.get_similar(key, q_emb)
+            if cached is not None:
+                out.write("(cached answer)\n" + cached)
+                return
+
+            # ask() returns its report rather than printing it, so nothing
+            # else the workers print can end up in (or cached as) the answer
+            report = ask(question, include=include, top_k=top_k, q_emb=q_emb, echo=False)
+            if report is None:
+                out.write("DB empty. Run ingest first.\n")
+                return
+            out.write(report)
+            self._ask_cache.put(key, q_emb, report)
 
         self.run_in_thread(ask_task)
 
+    def _parse_standard_ids(self, text: str) -> List[str]:
+        """Standard IDs from the combobox: one known ID, or a comma-separated list."""
+        text = text.strip()
+        if not text or text in (self._last_standards or ()):
+            return [text] if text else []
+        return [s.strip() for s in text.split(",") if s.strip()]
+
     def do_gap(self):
-        # Comboboxes
-        standard_id = self.gap_standard_combo.get().strip()
+        # Comboboxes (several standards may be given, comma-separated)
+        standard_ids = self._parse_standard_ids(self.gap_standard_combo.get())
         manual_id = self.gap_manual_combo.get().strip()
 
-        if not standard_id or not manual_id:
+        if not standard_ids or not manual_id:
             messagebox.showwarning("Warning", "Please select both Standard ID and Manual ID")
             return
 
@@ -365,19 +695,21 @@ class ManualGUI:
 
         out_csv = None
         out_html = None
+        # "{standard_id}" is filled in per standard by gap_batch
         if self.gap_csv_var.get():
-            out_csv = f"gap_{standard_id}_vs_{manual_id}.csv"
+            out_csv = f"gap_{{standard_id}}_vs_{manual_id}.csv"
         if self.gap_html_var.get():
-            out_html = f"gap_{standard_id}_vs_{manual_id}.html"
+            out_html = f"gap_{{standard_id}}_vs_{manual_id}.html"
 
-        self.gap_output.delete(1.0, tk.END)
+        self.clear_output(self.gap_output)
 
         def gap_task():
             old_stdout = sys.stdout
             sys.stdout = self.redirect_output(self.gap_output)
             try:
-                gap(
-                    standard_id,
+                # One call: DB load and manual embeddings shared by all standards
+                gap_batch(
+                    standard_ids,
                     manual_id,
                     start_index=start_index,
                     max_clauses=max_clauses,
@@ -392,24 +724,30 @@ class ManualGUI:
         self.run_in_thread(gap_task)
 
     def do_list(self):
-        self.list_output.delete(1.0, tk.END)
+        self.clear_output(self.list_output)
 
         def list_task():
-            old_stdout = sys.stdout
-            sys.stdout = self.redirect_output(self.list_output)
             try:
-                if use_sqlite():
-                    docs = self.fetch_docs_from_sqlite()
-                    print("\nDocuments (SQLite):\n")
-                    for mid, dt, n in docs:
-                        print(f" • {mid}: {n} chunks ({dt})")
-                else:
-                    list_manuals()
-            finally:
-                sys.stdout = old_stdout
+                docs = self._load_docs()
+            except Exception as e:
+                msg = str(e)
+                self.call_in_ui(messagebox.showerror, "Error", msg)
+                return
+            self.call_in_ui(self._show_docs_list, docs)
 
         self.run_in_thread(list_task)
 
+    def _show_docs_list(self, docs: List[Tuple[str, str, int]]):
+        """Main thread: write the document list (from one _load_docs fetch) to the list tab."""
+        self.clear_output(self.list_output)
+        if not docs:
+            self.list_output.insert(tk.END, "Database is empty. Run 'ingest' first.\n")
+            return
+        lines = ["", "Documents:", ""]
+        lines += [f" • {mid}: {n} chunks ({dt})" for mid, dt, n in docs]
+        lines += ["", f"Total: {sum(n for _, _, n in docs)}"]
+        self.list_output.insert(tk.END, "\n".join(lines) + "\n")
+
     def do_delete(self):
         manual_id = self.delete_id_entry.get().strip()
         if not manual_id:
@@ -419,17 +757,29 @@ class ManualGUI:
         if not messagebox.askyesno("Confirm", f"Delete manual '{manual_id}'?"):
             return
 
+        delete_file = self.delete_file_var.get()
+
         def delete_task():
             try:
-                delete_manual(manual_id, delete_file=self.delete_file_var.get())
-                messagebox.showinfo("Success", "Manual deleted")
-                self.do_list()
-                self.refresh_gap_ids()
+                delete_manual(manual_id, delete_file=delete_file)
+                self._ask_cache.clear()
+                self.invalidate_docs_cache()
+                # One document fetch feeds both the list tab and the gap dropdowns
+                docs = self._load_docs()
             except Exception as e:
-                messagebox.showerror("Error", str(e))
+                msg = str(e)
+                self.call_in_ui(messagebox.showerror, "Error", msg)
+                return
+            self.call_in_ui(self._apply_delete_ui, docs)
 
         self.run_in_thread(delete_task)
 
+    def _apply_delete_ui(self, docs: List[Tuple[str, str, int]]):
+        """Main-thread UI update after a delete: list tab and dropdowns from one fetch, then notice."""
+        self._show_docs_list(docs)
+        self._apply_docs_ui(docs)
+        messagebox.showinfo("Success", "Manual deleted")
+
     def do_export(self):
         manual_id = self.export_id_entry.get().strip()
         if not manual_id:
@@ -448,14 +798,23 @@ class ManualGUI:
         def export_task():
             try:
                 export_manual(manual_id, out_path=filename)
-                messagebox.showinfo("Success", f"Manual exported to {filename}")
+                self.call_in_ui(messagebox.showinfo, "Success", f"Manual exported to {filename}")
             except Exception as e:
-                messagebox.showerror("Error", str(e))
+                self.call_in_ui(messagebox.showerror, "Error", str(e))
 
         self.run_in_thread(export_task)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Manual Intelligence Engine GUI")
+    parser.add_argument("--jit", action="store_true",
+                        help="Score ask/gap similarity with the Numba kernel in fast_sim.py")
+    args = parser.parse_args()
+    if args.jit:
+        import fast_sim
+        if not fast_sim.install():
+            print("Warning: Numba not installed; --jit ignored.", file=sys.stderr)
+
     root = tk.Tk()
     app = ManualGUI(root)
     root.mainloop()
@@ -6,9 +6,13 @@ Migrates existing db.json to the new SQLite database structure.
 
 import os
 import json
+import argparse
 import sqlite3
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice
 import numpy as np
 
 # Try to import FAISS
@@ -18,44 +22,270 @@ except ImportError:
     print("Warning: FAISS not installed. Vector index will not be created.", file=sys.stderr)
     faiss = None
 
+# Optional: stream db.json instead of loading it whole (falls back to json)
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 # Import constants from manual_core
 from manual_core import (
     DB_PATH, SQLITE_DB_PATH, FAISS_INDEX_PATH,
     init_sqlite_db, detect_doc_type, generate_topic_id,
-    detect_emergency_procedure, extract_units
+    detect_emergency_procedure, extract_units, unit_rows,
+    CHUNK_UNITS_INSERT_SQL, AUDIT_INSERT_SQL
 )
 
 
-def migrate():
-    """Migrate from db.json to SQLite + FAISS."""
+# Below this many vectors exact search is already fast; above it, use HNSW
+HNSW_MIN_VECTORS = 10000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+
+# Bulk-load settings for the freshly created DB: a crash mid-migration just
+# means rerunning it, so journaling and fsyncs are skipped until the end
+MIGRATION_PRAGMAS = """
+    PRAGMA journal_mode=MEMORY;
+    PRAGMA synchronous=OFF;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-200000;
+"""
+# Settings the app expects afterwards
+RUNTIME_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+"""
+
+# Rows buffered per executemany while streaming chunks into SQLite
+INSERT_BATCH_SIZE = 1000
+
+# Enrich chunks in worker processes once the corpus is big enough to repay
+# the pool start-up; ENRICH_CHUNKSIZE chunks are pickled per task
+PARALLEL_MIN_CHUNKS = 5000
+ENRICH_CHUNKSIZE = 200
+
+
+def chunk_source(path):
+    """
+    Return a zero-argument callable yielding the chunks of a db.json file.
+    With ijson each call re-streams the file, so only one chunk is held in
+    memory at a time; without it the file is parsed once and reused.
+    """
+    if ijson is not None:
+        def stream():
+            with open(path, 'rb') as f:
+                yield from ijson.items(f, 'chunks.item', use_float=True)
+        return stream
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        chunks = json.load(f).get('chunks', [])
+    return lambda: iter(chunks)
+
+
+def enrich(chunk):
+    """
+    Build the SQLite chunk row for one db.json chunk, deriving topic id,
+    emergency flags and units when they are missing.
+    Returns (row, topic_id, chunk_units rows).
+    Pure function so it can run in a worker process.
+    """
+    chunk_id = chunk.get('id', '')
+    manual_id = chunk.get('manual_id', '')
+    text = chunk.get('text', '')
+    heading = chunk.get('heading', '')
+    path = chunk.get('path', '')
+    heading_num = chunk.get('heading_num', '')
+    level = chunk.get('level', 0)
+    
+    # Generate new metadata if not present
+    topic_id = chunk.get('topic_id') or generate_topic_id(heading)
+    
+    # Check for emergency procedures
+    is_emergency = chunk.get('is_emergency_procedure')
+    emergency_category = chunk.get('emergency_category')
+    
+    if is_emergency is None:
+        is_emergency, emergency_category = detect_emergency_procedure(text, heading)
+    
+    # Extract units if not present
+    units = chunk.get('units')
+    if units is None or units == []:
+        units = extract_units(text)
+    
+    row = (
+        chunk_id,
+        manual_id,
+        text,
+        heading,
+        path,
+        heading_num,
+        level,
+        topic_id,
+        1 if is_emergency else 0,
+        emergency_category,
+        json.dumps(units)
+    )
+    return row, topic_id, unit_rows(chunk_id, units)
+
+
+def enrich_chunks(chunks, total):
+    """
+    Yield (row, topic_id, chunk_units rows, embedding) for each chunk, in input order.
+    Large corpora are enriched in a process pool one window at a time, so
+    streaming still bounds memory; embeddings never leave this process.
+    """
+    workers = os.cpu_count() or 1
+    if total < PARALLEL_MIN_CHUNKS or workers < 2:
+        for chunk in chunks:
+            yield (*enrich(chunk), chunk.get('embedding'))
+        return
+    
+    window = ENRICH_CHUNKSIZE * workers * 4
+    chunks = iter(chunks)
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        while True:
+            batch = list(islice(chunks, window))
+            if not batch:
+                break
+            embeddings = [chunk.get('embedding') for chunk in batch]
+            stripped = [{k: v for k, v in chunk.items() if k != 'embedding'} for chunk in batch]
+            results = ex.map(enrich, stripped, chunksize=ENRICH_CHUNKSIZE)
+            for (row, topic_id, units), embedding in zip(results, embeddings):
+                yield row, topic_id, units, embedding
+
+
+def build_index(embeddings_array, quantize=False):
+    """
+    Build a FAISS inner-product index over L2-normalized vectors.
+    Small corpora get an exact IndexFlatIP; larger ones an HNSW graph
+    (logarithmic search instead of a full O(N*d) scan per query).
+    With quantize, vectors are stored as 8-bit scalar codes instead of
+    float32 (4x smaller index, small recall loss).
+    """
+    n, dimension = embeddings_array.shape
+    qtype = faiss.ScalarQuantizer.QT_8bit
+    if n < HNSW_MIN_VECTORS:
+        if quantize:
+            index = faiss.IndexScalarQuantizer(dimension, qtype, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexFlatIP(dimension)
+    else:
+        if quantize:
+            index = faiss.IndexHNSWSQ(dimension, qtype, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        # Scalar quantizers learn per-dimension ranges first
+        index.train(embeddings_array)
+    index.add(embeddings_array)
+    return index
+
+
+# build_faiss writes here first; publish_faiss moves the files into place
+# once the SQLite rows are committed, discard_faiss drops them otherwise
+FAISS_FILES = (FAISS_INDEX_PATH, FAISS_INDEX_PATH + ".ids")
+FAISS_TMP_SUFFIX = ".tmp"
+
+# Index types whose stored codes IO_FLAG_MMAP_IFC can map (see build_faiss)
+MMAP_INDEX_TYPES = {"IndexFlatIP", "IndexScalarQuantizer"}
+
+
+def build_faiss(embeddings_array, chunk_ids, quantize, result):
+    """
+    Normalize, index and save the vectors plus the chunk-ID sidecar to the
+    temporary FAISS_FILES paths. Runs on a background thread; the index
+    type or the raised exception is left in result. Flat-code indexes
+    (MMAP_INDEX_TYPES) can be memory-mapped by readers instead of copied
+    into RAM (faiss >= 1.8):
+    faiss.read_index(FAISS_INDEX_PATH, faiss.IO_FLAG_MMAP_IFC)
+    HNSW indexes are always loaded into RAM.
+    """
+    index_path, ids_path = (p + FAISS_TMP_SUFFIX for p in FAISS_FILES)
+    try:
+        # Normalize vectors for cosine similarity (inner product on unit vectors)
+        faiss.normalize_L2(embeddings_array)
+        index = build_index(embeddings_array, quantize=quantize)
+        faiss.write_index(index, index_path)
+        
+        # Save chunk ID mapping and how the vectors are stored
+        with open(ids_path, "w") as f:
+            json.dump({"dtype": "int8" if quantize else "float32", "ids": chunk_ids}, f)
+        result['index_type'] = type(index).__name__
+    except Exception as e:
+        result['error'] = e
+
+
+def publish_faiss():
+    """Replace the live index and sidecar with the ones build_faiss wrote."""
+    for path in FAISS_FILES:
+        os.replace(path + FAISS_TMP_SUFFIX, path)
+
+
+def discard_faiss():
+    """Remove build_faiss output, leaving any existing index untouched."""
+    for path in FAISS_FILES:
+        try:
+            os.remove(path + FAISS_TMP_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+
+def migrate(quantize=False):
+    """Migrate from db.json to SQLite + FAISS (8-bit quantized vectors if quantize)."""
     
     print("="*80)
     print("DATABASE MIGRATION: JSON → SQLite + FAISS")
     print("="*80)
     
-    # Check if source exists
-    if not os.path.exists(DB_PATH):
+    # Check if source exists (one stat; its size is reported below)
+    try:
+        db_stat = os.stat(DB_PATH)
+    except FileNotFoundError:
         print(f"\nError: Source database '{DB_PATH}' not found.")
         print("Nothing to migrate.")
         return False
     
     # Check if target already exists
-    if os.path.exists(SQLITE_DB_PATH):
+    try:
+        os.stat(SQLITE_DB_PATH)
+    except FileNotFoundError:
+        pass
+    else:
         response = input(f"\nWarning: '{SQLITE_DB_PATH}' already exists. Overwrite? (yes/no): ")
         if response.lower() != 'yes':
             print("Migration cancelled.")
             return False
-        os.remove(SQLITE_DB_PATH)
-    
-    # Load JSON database
-    print(f"\n[1/5] Loading {DB_PATH}...")
-    with open(DB_PATH, 'r', encoding='utf-8') as f:
-        db = json.load(f)
-    
-    chunks = db.get('chunks', [])
-    print(f"      Found {len(chunks)} chunks")
+        try:
+            os.remove(SQLITE_DB_PATH)
+        except FileNotFoundError:
+            pass
+    
+    # Scan JSON database: counts, FAISS dimension and per-document metadata
+    print(f"\n[1/5] Loading {DB_PATH} ({db_stat.st_size / (1024 * 1024):.1f} MB)...")
+    iter_chunks = chunk_source(DB_PATH)
+    
+    total_chunks = 0
+    n_vectors = 0
+    dimension = 0
+    manuals = {}
+    for chunk in iter_chunks():
+        total_chunks += 1
+        embedding = chunk.get('embedding')
+        if embedding:
+            dimension = dimension or len(embedding)
+            n_vectors += 1
+        manual_id = chunk.get('manual_id', '')
+        if manual_id and manual_id not in manuals:
+            # Detect doc_type from filename or first chunk now, so the
+            # chunk text is not kept around for the rest of the migration
+            manuals[manual_id] = {
+                'doc_type': detect_doc_type(manual_id, chunk.get('text', '')),
+                'file_path': f"manuals/{manual_id}.txt"  # Reconstruct likely path
+            }
+    print(f"      Found {total_chunks} chunks")
     
-    if not chunks:
+    if not total_chunks:
         print("      No chunks to migrate.")
         return False
     
@@ -63,156 +293,138 @@ def migrate():
     print(f"\n[2/5] Initializing SQLite database at {SQLITE_DB_PATH}...")
     init_sqlite_db()
     conn = sqlite3.connect(SQLITE_DB_PATH)
+    conn.executescript(MIGRATION_PRAGMAS)
     cursor = conn.cursor()
     
-    # Extract unique manuals
     print("\n[3/5] Migrating document metadata...")
-    manuals = {}
-    for chunk in chunks:
-        manual_id = chunk.get('manual_id', '')
-        if manual_id and manual_id not in manuals:
-            manuals[manual_id] = {
-                'first_text': chunk.get('text', ''),
-                'file_path': f"manuals/{manual_id}.txt"  # Reconstruct likely path
-            }
-    
     print(f"      Found {len(manuals)} unique documents")
     
-    # Insert documents
+    # Every row of one migration shares a single timestamp (naive UTC,
+    # the format manual_core writes everywhere else)
+    now_iso = datetime.utcnow().isoformat()
+    
+    document_rows = []
     for manual_id, info in manuals.items():
-        # Try to detect doc_type from filename or content
-        doc_type = detect_doc_type(manual_id, info['first_text'])
-        
-        cursor.execute('''
-            INSERT INTO documents (manual_id, doc_type, file_path, ingested_at)
-            VALUES (?, ?, ?, ?)
-        ''', (manual_id, doc_type, info['file_path'], datetime.utcnow().isoformat()))
-        
+        doc_type = info['doc_type']
+        document_rows.append((manual_id, doc_type, info['file_path'], now_iso))
         print(f"      - {manual_id} (detected as: {doc_type})")
     
-    conn.commit()
-    
     # Migrate chunks
     print("\n[4/5] Migrating chunks with enhanced metadata...")
     topics_seen = set()
-    all_embeddings = []
+    topic_rows = []
+    chunk_rows = []
+    units_rows = []
     all_chunk_ids = []
     
-    migrated_count = 0
-    for chunk in chunks:
-        chunk_id = chunk.get('id', '')
-        manual_id = chunk.get('manual_id', '')
-        text = chunk.get('text', '')
-        heading = chunk.get('heading', '')
-        path = chunk.get('path', '')
-        heading_num = chunk.get('heading_num', '')
-        level = chunk.get('level', 0)
-        
-        # Generate new metadata if not present
-        topic_id = chunk.get('topic_id') or generate_topic_id(heading)
-        
-        # Check for emergency procedures
-        is_emergency = chunk.get('is_emergency_procedure')
-        emergency_category = chunk.get('emergency_category')
-        
-        if is_emergency is None:
-            is_emergency, emergency_category = detect_emergency_procedure(text, heading)
-        
-        # Extract units if not present
-        units = chunk.get('units')
-        if units is None or units == []:
-            units = extract_units(text)
-        
-        # Insert chunk
-        cursor.execute('''
+    # Vectors are copied straight into one preallocated float32 buffer
+    # (no intermediate list of lists, no second full copy)
+    embeddings_array = np.empty((n_vectors, dimension), dtype=np.float32)
+    
+    def flush_rows():
+        cursor.executemany('''
             INSERT INTO chunks 
             (id, manual_id, text, heading, path, heading_num, level, 
              topic_id, is_emergency_procedure, emergency_category, units)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            chunk_id,
-            manual_id,
-            text,
-            heading,
-            path,
-            heading_num,
-            level,
-            topic_id,
-            1 if is_emergency else 0,
-            emergency_category,
-            json.dumps(units)
-        ))
+        ''', chunk_rows)
+        cursor.executemany('''
+            INSERT OR IGNORE INTO topics (topic_id, first_seen)
+            VALUES (?, ?)
+        ''', topic_rows)
+        cursor.executemany(CHUNK_UNITS_INSERT_SQL, units_rows)
+        chunk_rows.clear()
+        topic_rows.clear()
+        units_rows.clear()
+    
+    migrated_count = 0
+    faiss_result = {}
+    faiss_thread = None
+    try:
+        # Single transaction for all rows: one commit (and fsync) instead of one
+        # per batch; rows are flushed every INSERT_BATCH_SIZE to bound memory
+        with conn:
+            cursor.executemany('''
+                INSERT INTO documents (manual_id, doc_type, file_path, ingested_at)
+                VALUES (?, ?, ?, ?)
+            ''', document_rows)
         
-        # Register topic
-        if topic_id and topic_id not in topics_seen:
-            cursor.execute('''
-                INSERT OR IGNORE INTO topics (topic_id, first_seen)
-                VALUES (?, ?)
-            ''', (topic_id, datetime.utcnow().isoformat()))
-            topics_seen.add(topic_id)
+            for row, topic_id, units, embedding in enrich_chunks(iter_chunks(), total_chunks):
+                chunk_rows.append(row)
+                units_rows.extend(units)
+            
+                # Register topic
+                if topic_id and topic_id not in topics_seen:
+                    topic_rows.append((topic_id, now_iso))
+                    topics_seen.add(topic_id)
+            
+                # Collect embeddings for FAISS
+                if embedding:
+                    embeddings_array[len(all_chunk_ids)] = embedding
+                    all_chunk_ids.append(row[0])
+            
+                migrated_count += 1
+                if migrated_count % INSERT_BATCH_SIZE == 0:
+                    flush_rows()
+                    print(f"      Migrated {migrated_count}/{total_chunks} chunks...")
         
-        # Collect embeddings for FAISS
-        embedding = chunk.get('embedding')
-        if embedding:
-            all_embeddings.append(embedding)
-            all_chunk_ids.append(chunk_id)
+            # All embeddings are collected: build the FAISS index (CPU-bound,
+            # releases the GIL) while the last rows are written and committed
+            if faiss and n_vectors:
+                faiss_thread = threading.Thread(
+                    target=build_faiss, args=(embeddings_array, all_chunk_ids, quantize, faiss_result),
+                    name="faiss-build"
+                )
+                faiss_thread.start()
         
-        migrated_count += 1
-        if migrated_count % 100 == 0:
-            print(f"      Migrated {migrated_count}/{len(chunks)} chunks...")
+            flush_rows()
+    except BaseException:
+        # Rows rolled back: the index being built would not match them
+        if faiss_thread is not None:
+            faiss_thread.join()
+            discard_faiss()
+        raise
     
-    conn.commit()
     print(f"      ✓ Migrated {migrated_count} chunks with enhanced metadata")
     print(f"      ✓ Registered {len(topics_seen)} unique topics")
     
-    # Create FAISS index
-    print("\n[5/5] Building FAISS vector index...")
-    if faiss and all_embeddings:
-        embeddings_array = np.array(all_embeddings, dtype='float32')
-        dimension = embeddings_array.shape[1]
-        
-        print(f"      Dimension: {dimension}")
-        print(f"      Vectors: {len(all_embeddings)}")
-        
-        # Use IndexFlatIP for cosine similarity (after normalization)
-        index = faiss.IndexFlatIP(dimension)
-        
-        # Normalize vectors for cosine similarity
-        faiss.normalize_L2(embeddings_array)
-        index.add(embeddings_array)
-        
-        # Save index
-        faiss.write_index(index, FAISS_INDEX_PATH)
-        
-        # Save chunk ID mapping
-        with open(FAISS_INDEX_PATH + ".ids", "w") as f:
-            json.dump(all_chunk_ids, f)
-        
-        print(f"      ✓ FAISS index saved to {FAISS_INDEX_PATH}")
-    elif not faiss:
-        print("      ⚠ FAISS not available - skipping vector index")
-    else:
-        print("      ⚠ No embeddings found - skipping vector index")
-    
     # Log migration
-    cursor.execute('''
-        INSERT INTO audit_log (timestamp, user, action, details)
-        VALUES (?, ?, ?, ?)
-    ''', (
-        datetime.utcnow().isoformat(),
+    cursor.execute(AUDIT_INSERT_SQL, (
+        now_iso,
         'system',
         'migrate_database',
         f'Migrated {migrated_count} chunks from {DB_PATH}'
     ))
     
     conn.commit()
+    conn.executescript(RUNTIME_PRAGMAS)
     conn.close()
     
+    # Collect the FAISS index started during the chunk pass
+    print("\n[5/5] Building FAISS vector index...")
+    if faiss_thread is not None:
+        print(f"      Dimension: {dimension}")
+        print(f"      Vectors: {n_vectors}")
+        faiss_thread.join()
+        if 'error' in faiss_result:
+            discard_faiss()
+            raise faiss_result['error']
+        publish_faiss()
+        print(f"      Index type: {faiss_result['index_type']}")
+        print(f"      ✓ FAISS index saved to {FAISS_INDEX_PATH}")
+        if faiss_result['index_type'] in MMAP_INDEX_TYPES and hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            print("      Tip: load it memory-mapped (shared pages, no RAM copy):")
+            print(f"        faiss.read_index('{FAISS_INDEX_PATH}', faiss.IO_FLAG_MMAP_IFC)")
+    elif not faiss:
+        print("      ⚠ FAISS not available - skipping vector index")
+    else:
+        print("      ⚠ No embeddings found - skipping vector index")
+    
     print("\n" + "="*80)
     print("MIGRATION COMPLETE!")
     print("="*80)
     print(f"\n✓ SQLite database: {SQLITE_DB_PATH}")
-    if faiss and all_embeddings:
+    if faiss and n_vectors:
         print(f"✓ FAISS index: {FAISS_INDEX_PATH}")
     print(f"✓ Documents: {len(manuals)}")
     print(f"✓ Chunks: {migrated_count}")
@@ -237,29 +449,21 @@ def verify_migration():
     conn = sqlite3.connect(SQLITE_DB_PATH)
     cursor = conn.cursor()
     
-    # Check documents
-    cursor.execute("SELECT COUNT(*) FROM documents")
-    doc_count = cursor.fetchone()[0]
+    # All counts in one statement / round-trip (each COUNT(*) walks the
+    # table's smallest b-tree; sqlite_stat1 would need an ANALYZE scan first)
+    cursor.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM documents),
+            (SELECT COUNT(*) FROM chunks),
+            (SELECT COUNT(*) FROM topics),
+            (SELECT COUNT(*) FROM chunks WHERE is_emergency_procedure = 1),
+            (SELECT COUNT(*) FROM audit_log)
+    """)
+    doc_count, chunk_count, topic_count, emergency_count, audit_count = cursor.fetchone()
     print(f"\n✓ Documents table: {doc_count} records")
-    
-    # Check chunks
-    cursor.execute("SELECT COUNT(*) FROM chunks")
-    chunk_count = cursor.fetchone()[0]
     print(f"✓ Chunks table: {chunk_count} records")
-    
-    # Check topics
-    cursor.execute("SELECT COUNT(*) FROM topics")
-    topic_count = cursor.fetchone()[0]
     print(f"✓ Topics table: {topic_count} records")
-    
-    # Check emergency procedures
-    cursor.execute("SELECT COUNT(*) FROM chunks WHERE is_emergency_procedure = 1")
-    emergency_count = cursor.fetchone()[0]
     print(f"✓ Emergency procedures: {emergency_count} chunks")
-    
-    # Check audit log
-    cursor.execute("SELECT COUNT(*) FROM audit_log")
-    audit_count = cursor.fetchone()[0]
     print(f"✓ Audit log: {audit_count} events")
     
     conn.close()
@@ -275,10 +479,15 @@ def verify_migration():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate db.json to SQLite + FAISS.")
+    parser.add_argument("--quantize", action="store_true",
+                        help="Store FAISS vectors as 8-bit codes (about 4x smaller index).")
+    args = parser.parse_args()
+    
     print("Manual Intelligence Engine - Database Migration Tool")
     print("This will migrate your db.json to SQLite + FAISS format.\n")
     
-    success = migrate()
+    success = migrate(quantize=args.quantize)
     
     if success:
         print("\nRunning verification...")
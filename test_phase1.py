@@ -2,14 +2,25 @@
 """
 Basic tests for Phase 1 functionality.
 Tests helper functions, database operations, and metadata extraction.
+Run with: pytest -q test_phase1.py
+In parallel (needs pytest-xdist): pytest -q -n auto test_phase1.py
+
+Benchmarks (need pytest-benchmark, skipped otherwise):
+    pytest test_phase1.py --benchmark-only --benchmark-autosave
+    pytest test_phase1.py --benchmark-only --benchmark-compare --benchmark-compare-fail=mean:10%
 """
 
-import os
+import importlib.util
+import json
+import sqlite3
 import sys
-import tempfile
-import shutil
-from datetime import datetime
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
 
+import manual_core
 # Import functions to test
 from manual_core import (
     generate_topic_id,
@@ -19,262 +30,444 @@ from manual_core import (
     init_sqlite_db,
     get_db_connection,
     log_audit_event,
+    log_audit_events_bulk,
     SQLITE_DB_PATH
 )
 
 
-def test_topic_id_generation():
-    """Test that topic_id generation is deterministic and correct."""
-    print("\n=== Testing Topic ID Generation ===")
+# Parametrize cases, built once at import
+TOPIC_ID_CASES = (
+    ("1.5 Bailout Gas Requirements", "bailout_gas_requirements"),
+    ("3.2.1 Deck Decompression Chamber Operation", "deck_decompression_chamber_operation"),
+    ("EMERGENCY PROCEDURES", "emergency_procedures"),
+    ("2 DIVING OPERATIONS", "diving_operations"),
+    ("Safety Equipment", "safety_equipment"),
+    ("", ""),
+)
+
+EMERGENCY_CASES = (
+    ("This describes bailout gas requirements", "Bailout Gas", True, "bailout"),
+    ("Emergency procedures for equipment failure", "Emergency", True, "equipment_failure"),  # "equipment failure" keyword matched first in new ruleset
+    ("Abort procedures in case of weather", "Weather Abort", True, "abort"),  # "abort" keyword matched first
+    ("Normal diving operations", "Standard Ops", False, None),
+    ("Medical emergency requiring first aid", "Medical Emergency", True, "medical"),  # Using "medical emergency" keyword
+)
+
+UNIT_CASES = (
+    ("The depth is 30 metres", [("30", "meters")]),
+    ("Pressure must be 50 bar minimum", [("50", "bar")]),
+    ("Tank capacity is 3000 psi or 200 bar", [("3000", "psi"), ("200", "bar")]),
+    ("Distance of 100 feet", [("100", "feet")]),
+    ("Volume is 12 litres or 0.42 cf", [("12", "litres"), ("0.42", "cubic_feet")]),
+    ("No units in this text", []),
+)
+
+DOC_TYPE_CASES = (
+    ("Manual - Diving Operations.txt", "manual"),
+    ("IMCA D014 Standard.txt", "standard"),
+    ("Safety Guidance Document.txt", "guidance"),
+    ("HSE Diving Regulations Act.txt", "legislation"),  # "act" keyword will match
+    ("Client Specification.txt", "client_spec"),
+    ("Procedure Manual.txt", "manual"),
+)
+
+
+EXPECTED_TABLES = frozenset({"documents", "chunks", "topics", "audit_log", "chunk_units"})
+
+
+@pytest.mark.parametrize("heading, expected", TOPIC_ID_CASES)
+def test_topic_id_generation(heading, expected):
+    """Test that topic_id generation is correct."""
+    assert generate_topic_id(heading) == expected
+
+
+def test_topic_id_deterministic():
+    """Same input always gives the same topic_id."""
+    heading = "1.5 Bailout Gas Requirements"
+    assert generate_topic_id(heading) == generate_topic_id(heading)
+
+
+@pytest.mark.parametrize("text, heading, expected_is_em, expected_cat", EMERGENCY_CASES)
+def test_emergency_detection(text, heading, expected_is_em, expected_cat):
+    """Test emergency procedure detection."""
+    is_em, cat = detect_emergency_procedure(text, heading)
+    assert is_em == expected_is_em
+    if expected_is_em:
+        assert cat == expected_cat
+
+
+@pytest.mark.parametrize("text, expected_units", UNIT_CASES)
+def test_unit_extraction(text, expected_units):
+    """Test unit extraction from text."""
+    # Order-insensitive, but still counts repeats (a set would not)
+    found_units = Counter((u['value'], u['unit']) for u in extract_units(text))
+    assert found_units == Counter(expected_units)
+
+
+@pytest.mark.parametrize("filename, expected_type", DOC_TYPE_CASES)
+def test_doc_type_detection(filename, expected_type):
+    """Test document type auto-detection."""
+    assert detect_doc_type(filename) == expected_type
+
+
+
+def test_delete_manual_removes_sqlite_rows(tmp_path, monkeypatch):
+    """delete_manual drops the manual from db.json and from SQLite documents/chunks/chunk_units."""
+    monkeypatch.setattr(manual_core, "DB_PATH", str(tmp_path / "db.json"))
+    monkeypatch.setattr(manual_core, "SQLITE_DB_PATH", str(tmp_path / "t.db"))
+    init_sqlite_db()
+    manual_core.save_db({"chunks": [
+        {"id": "A::C0", "manual_id": "A"}, {"id": "B::C0", "manual_id": "B"},
+    ]})
+    conn = get_db_connection()
+    with conn:
+        conn.executemany("INSERT INTO documents (manual_id, doc_type) VALUES (?, 'manual')", [("A",), ("B",)])
+        conn.executemany("INSERT INTO chunks (id, manual_id, text) VALUES (?, ?, '')",
+                         [("A::C0", "A"), ("B::C0", "B")])
+        conn.executemany("INSERT INTO chunk_units (chunk_id, unit, value) VALUES (?, 'bar', 50)",
+                         [("A::C0",), ("B::C0",)])
+    
+    manual_core.delete_manual("A")
     
-    test_cases = [
-        ("1.5 Bailout Gas Requirements", "bailout_gas_requirements"),
-        ("3.2.1 Deck Decompression Chamber Operation", "deck_decompression_chamber_operation"),
-        ("EMERGENCY PROCEDURES", "emergency_procedures"),
-        ("2 DIVING OPERATIONS", "diving_operations"),
-        ("Safety Equipment", "safety_equipment"),
-        ("", ""),
+    assert [c["id"] for c in manual_core.load_db()["chunks"]] == ["B::C0"]
+    assert conn.execute("SELECT manual_id FROM documents").fetchall() == [("B",)]
+    assert conn.execute("SELECT id FROM chunks").fetchall() == [("B::C0",)]
+    assert conn.execute("SELECT chunk_id FROM chunk_units").fetchall() == [("B::C0",)]
+    manual_core.close_db_connection()
+
+
+def test_ask_returns_report(monkeypatch, capsys):
+    """ask() returns its answer report; echo=False keeps it off stdout."""
+    chunks = [
+        {"id": "M::C0", "manual_id": "M", "text": "Depth limit 50 m", "embedding": [1.0, 0.0]},
+        {"id": "M::C1", "manual_id": "M", "text": "Bailout checks", "embedding": [0.0, 1.0]},
     ]
+    monkeypatch.setattr(manual_core, "load_db", lambda: {"chunks": chunks})
+    reply = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="50 m"))])
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kw: reply)))
+    monkeypatch.setattr(manual_core, "get_client", lambda: client)
     
-    passed = 0
-    failed = 0
+    report = manual_core.ask("max depth?", top_k=1, q_emb=[1.0, 0.1], echo=False)
+    assert capsys.readouterr().out == ""
+    assert report == "\n===== ANSWER =====\n\n50 m\n\n===== SOURCES USED =====\n\n1. M | M::C0 | sim=0.995\n"
     
-    for input_text, expected in test_cases:
-        result = generate_topic_id(input_text)
-        if result == expected:
-            print(f"  ✓ '{input_text}' → '{result}'")
-            passed += 1
-        else:
-            print(f"  ✗ '{input_text}' → '{result}' (expected: '{expected}')")
-            failed += 1
+    assert manual_core.ask("max depth?", top_k=1, q_emb=[1.0, 0.1]) == report
+    assert capsys.readouterr().out == report
+
+
+@pytest.fixture
+def ask_cache():
+    """A small AskCache (manual_gui needs tkinter; skipped without it)."""
+    manual_gui = pytest.importorskip("manual_gui")
+    return manual_gui.AskCache(maxsize=2, threshold=0.95)
+
+
+def test_ask_cache_exact_hit(ask_cache):
+    """Keys normalize case/whitespace of the question and the include scope."""
+    ask_cache.put(ask_cache.make_key("What is  the MAX depth?", ["IMCA", "Annexe"], 12),
+                  np.array([1.0, 0.0]), "50 m")
+    assert ask_cache.get(ask_cache.make_key("what is the max depth?", ["annexe", "imca"], 12)) == "50 m"
+    assert ask_cache.get(ask_cache.make_key("what is the max depth?", ["annexe", "imca"], 5)) is None
+
+
+def test_ask_cache_similar_hit_and_miss(ask_cache):
+    """Near-duplicate embeddings reuse the answer only at or above the threshold."""
+    ask_cache.put(ask_cache.make_key("max depth?", None, 12), np.array([1.0, 0.0]), "50 m")
+    key = ask_cache.make_key("maximum depth?", None, 12)
+    assert ask_cache.get_similar(key, np.array([1.0, 0.1])) == "50 m"   # cos ~0.995
+    assert ask_cache.get_similar(key, np.array([1.0, 0.5])) is None     # cos ~0.894
+
+
+def test_ask_cache_scope_mismatch(ask_cache):
+    """A similar question with another include scope or top_k is not a hit."""
+    ask_cache.put(ask_cache.make_key("max depth?", ["imca"], 12), np.array([1.0, 0.0]), "50 m")
+    emb = np.array([1.0, 0.0])
+    assert ask_cache.get_similar(ask_cache.make_key("max depth?", ["norsok"], 12), emb) is None
+    assert ask_cache.get_similar(ask_cache.make_key("max depth?", None, 12), emb) is None
+    assert ask_cache.get_similar(ask_cache.make_key("max depth?", ["imca"], 6), emb) is None
+
+
+def test_ask_cache_lru_eviction(ask_cache):
+    """Beyond maxsize the least recently used entry goes; get() refreshes recency."""
+    keys = [ask_cache.make_key(q, None, 12) for q in ("a?", "b?", "c?")]
+    ask_cache.put(keys[0], np.array([1.0, 0.0]), "A")
+    ask_cache.put(keys[1], np.array([0.0, 1.0]), "B")
+    assert ask_cache.get(keys[0]) == "A"
+    ask_cache.put(keys[2], np.array([1.0, 1.0]), "C")
+    assert ask_cache.get(keys[1]) is None
+    assert [ask_cache.get(k) for k in (keys[0], keys[2])] == ["A", "C"]
+    ask_cache.clear()
+    assert ask_cache.get(keys[0]) is None
+
+
+INGEST_PARAGRAPH = (
+    "The diver shall check the bailout cylinder pressure of 200 bar before every dive "
+    "and record it in the log. "
+) * 3
+# Three chunks; the first two have identical text
+INGEST_MANUAL_TEXT = (
+    "1 GENERAL\n\n" + INGEST_PARAGRAPH + "\n\n2 BAILOUT\n\n" + INGEST_PARAGRAPH +
+    "\n\n3 DEPTH\n\nMaximum depth is 50 metres for surface supplied air diving "
+    "operations on this vessel at all times.\n"
+)
+
+
+@pytest.fixture
+def ingest_env(tmp_path, monkeypatch):
+    """Manuals dir and DB files under tmp_path, embed_texts stubbed (texts recorded), FAISS off."""
+    manuals = tmp_path / "manuals"
+    manuals.mkdir()
+    monkeypatch.setattr(manual_core, "MANUALS_DIR", str(manuals))
+    monkeypatch.setattr(manual_core, "REPORTS_DIR", str(tmp_path / "reports"))
+    monkeypatch.setattr(manual_core, "DB_PATH", str(tmp_path / "db.json"))
+    monkeypatch.setattr(manual_core, "SQLITE_DB_PATH", str(tmp_path / "t.db"))
+    monkeypatch.setattr(manual_core, "FAISS_INDEX_PATH", str(tmp_path / "embeddings.faiss"))
+    monkeypatch.setattr(manual_core, "get_faiss", lambda: None)
+    embedded = []
     
-    # Test determinism (same input = same output)
-    test_heading = "1.5 Bailout Gas Requirements"
-    result1 = generate_topic_id(test_heading)
-    result2 = generate_topic_id(test_heading)
-    if result1 == result2:
-        print(f"  ✓ Deterministic: '{test_heading}' always gives '{result1}'")
-        passed += 1
-    else:
-        print(f"  ✗ Not deterministic: got different results")
-        failed += 1
+    def fake_embed(texts):
+        embedded.extend(texts)
+        return [[float(len(t)), 1.0] for t in texts]
     
-    return passed, failed
+    monkeypatch.setattr(manual_core, "embed_texts", fake_embed)
+    yield manuals, embedded
+    manual_core.close_db_connection()
 
 
-def test_emergency_detection():
-    """Test emergency procedure detection."""
-    print("\n=== Testing Emergency Detection ===")
-    
-    test_cases = [
-        ("This describes bailout gas requirements", "Bailout Gas", True, "bailout"),
-        ("Emergency procedures for equipment failure", "Emergency", True, "equipment_failure"),  # "equipment failure" keyword matched first in new ruleset
-        ("Abort procedures in case of weather", "Weather Abort", True, "abort"),  # "abort" keyword matched first
-        ("Normal diving operations", "Standard Ops", False, None),
-        ("Medical emergency requiring first aid", "Medical Emergency", True, "medical"),  # Using "medical emergency" keyword
-    ]
+def test_ingest_dedup_and_batches(ingest_env):
+    """Duplicate texts hit embed_texts once; small batches still write every chunk and unit row."""
+    manuals, embedded = ingest_env
+    (manuals / "A.txt").write_text(INGEST_MANUAL_TEXT, encoding="utf-8")
+    (manuals / "B.txt").write_text(INGEST_MANUAL_TEXT, encoding="utf-8")
     
-    passed = 0
-    failed = 0
+    manual_core.ingest(batch_size=2)
     
-    for text, heading, expected_is_em, expected_cat in test_cases:
-        is_em, cat = detect_emergency_procedure(text, heading)
-        if is_em == expected_is_em and (not expected_is_em or cat == expected_cat):
-            print(f"  ✓ '{heading}': is_emergency={is_em}, category={cat}")
-            passed += 1
-        else:
-            print(f"  ✗ '{heading}': got ({is_em}, {cat}), expected ({expected_is_em}, {expected_cat})")
-            failed += 1
+    assert len(embedded) == len(set(embedded)) == 2
+    json_chunks = manual_core.load_db()["chunks"]
+    assert len(json_chunks) == 6
+    # Every duplicate still carries its own (reused) embedding
+    assert all(c["embedding"] == [float(len(c["text"])), 1.0] for c in json_chunks)
     
-    return passed, failed
+    conn = get_db_connection()
+    rows = conn.execute("SELECT id, units FROM chunks ORDER BY id").fetchall()
+    assert [r[0] for r in rows] == sorted(c["id"] for c in json_chunks)
+    n_units = conn.execute("SELECT COUNT(*) FROM chunk_units").fetchone()[0]
+    assert n_units == sum(len(json.loads(units)) for _, units in rows) > 0
 
 
-def test_unit_extraction():
-    """Test unit extraction from text."""
-    print("\n=== Testing Unit Extraction ===")
+def test_ingest_failure_rolls_back(ingest_env, monkeypatch):
+    """A failed re-ingest keeps the previous chunks and leaves the thread connection reusable."""
+    manuals, _ = ingest_env
+    (manuals / "A.txt").write_text(INGEST_MANUAL_TEXT, encoding="utf-8")
+    manual_core.ingest()
     
-    test_cases = [
-        ("The depth is 30 metres", [("30", "meters")]),
-        ("Pressure must be 50 bar minimum", [("50", "bar")]),
-        ("Tank capacity is 3000 psi or 200 bar", [("3000", "psi"), ("200", "bar")]),
-        ("Distance of 100 feet", [("100", "feet")]),
-        ("Volume is 12 litres or 0.42 cf", [("12", "litres"), ("0.42", "cubic_feet")]),
-        ("No units in this text", []),
-    ]
+    def failing_embed(texts):
+        raise RuntimeError("embedding service down")
+    
+    monkeypatch.setattr(manual_core, "embed_texts", failing_embed)
+    with pytest.raises(RuntimeError):
+        manual_core.ingest()
     
-    passed = 0
-    failed = 0
+    conn = get_db_connection()
+    assert conn.isolation_level == "" and not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM chunks WHERE manual_id = 'A'").fetchone()[0] == 3
     
-    for text, expected_units in test_cases:
-        units = extract_units(text)
-        found_units = [(u['value'], u['unit']) for u in units]
-        
-        if len(found_units) == len(expected_units) and all(u in found_units for u in expected_units):
-            print(f"  ✓ '{text[:50]}...' → {len(found_units)} units")
-            passed += 1
-        else:
-            print(f"  ✗ '{text[:50]}...' → found {found_units}, expected {expected_units}")
-            failed += 1
+    # Failures before the per-manual transaction restore the connection too
+    def failing_read(path):
+        raise OSError("unreadable")
     
-    return passed, failed
+    monkeypatch.setattr(manual_core, "read_manual_file", failing_read)
+    with pytest.raises(OSError):
+        manual_core.ingest()
+    assert get_db_connection().isolation_level == ""
 
 
-def test_doc_type_detection():
-    """Test document type auto-detection."""
-    print("\n=== Testing Document Type Detection ===")
-    
-    test_cases = [
-        ("Manual - Diving Operations.txt", "manual"),
-        ("IMCA D014 Standard.txt", "standard"),
-        ("Safety Guidance Document.txt", "guidance"),
-        ("HSE Diving Regulations Act.txt", "legislation"),  # "act" keyword will match
-        ("Client Specification.txt", "client_spec"),
-        ("Procedure Manual.txt", "manual"),
+def test_gap_clause_header_and_topk_order(monkeypatch, capsys):
+    """Each clause header shows its 1-based number; context lists manual chunks best-first."""
+    contexts = []
+    monkeypatch.setattr(
+        manual_core, "analyze_gap",
+        lambda std_text, ctx, standard_id, manual_id: contexts.append(ctx) or "Covered"
+    )
+    man_chunks = [{"id": f"M::C{i}", "text": f"manual {i}"} for i in range(4)]
+    man_matrix = np.array([[1.0, 0.0], [0.6, 0.8], [0.8, 0.6], [0.0, 1.0]])
+    std_chunks = [
+        {"id": "S::C0", "text": "first", "embedding": np.array([1.0, 0.0])},
+        {"id": "S::C1", "text": "second", "embedding": np.array([0.0, 1.0])},
     ]
+    manual_core._gap_clauses(std_chunks, man_chunks, man_matrix, "S", "M",
+                             top_n=3, min_sim=0.1, out_csv=None, out_html=None)
     
-    passed = 0
-    failed = 0
-    
-    for filename, expected_type in test_cases:
-        doc_type = detect_doc_type(filename)
-        if doc_type == expected_type:
-            print(f"  ✓ '{filename}' → '{doc_type}'")
-            passed += 1
-        else:
-            print(f"  ✗ '{filename}' → '{doc_type}' (expected: '{expected_type}')")
-            failed += 1
-    
-    return passed, failed
+    out = capsys.readouterr().out
+    assert "STANDARD CHUNK 1 | S::C0 | best_sim=1.000" in out
+    assert "STANDARD CHUNK 2 | S::C1 | best_sim=1.000" in out
+    ranked = [[line.split(" | ")[1] for line in ctx.splitlines() if line.startswith("[")]
+              for ctx in contexts]
+    assert ranked == [["M::C0", "M::C2", "M::C1"], ["M::C3", "M::C1", "M::C2"]]
+
+# Helper microbenchmarks over the same cases; inputs are unpacked up front
+# so only the helper calls are timed
+requires_benchmark = pytest.mark.skipif(
+    importlib.util.find_spec("pytest_benchmark") is None,
+    reason="pytest-benchmark not installed",
+)
+
+TOPIC_ID_INPUTS = tuple(heading for heading, _ in TOPIC_ID_CASES)
+EMERGENCY_INPUTS = tuple((text, heading) for text, heading, _, _ in EMERGENCY_CASES)
+UNIT_INPUTS = tuple(text for text, _ in UNIT_CASES)
+DOC_TYPE_INPUTS = tuple(filename for filename, _ in DOC_TYPE_CASES)
+
+
+def run_bench(benchmark, run, expected, key=None):
+    """Warm up once, then time run; results (mapped by key) must match the cases."""
+    run()
+    results = benchmark(run)
+    if key is not None:
+        results = [key(r) for r in results]
+    assert results == list(expected)
+
+
+def unit_counts(units):
+    """extract_units output as a Counter of (value, unit), as in test_unit_extraction."""
+    return Counter((u['value'], u['unit']) for u in units)
+
+
+@requires_benchmark
+def test_bench_topic_id(benchmark):
+    run_bench(benchmark, lambda: [generate_topic_id(h) for h in TOPIC_ID_INPUTS],
+              (expected for _, expected in TOPIC_ID_CASES))
 
 
-def test_database_operations():
-    """Test SQLite database initialization and operations."""
-    print("\n=== Testing Database Operations ===")
+@requires_benchmark
+def test_bench_emergency_detection(benchmark):
+    run_bench(benchmark, lambda: [detect_emergency_procedure(t, h) for t, h in EMERGENCY_INPUTS],
+              ((is_em, cat) for _, _, is_em, cat in EMERGENCY_CASES))
+
+
+@requires_benchmark
+def test_bench_unit_extraction(benchmark):
+    run_bench(benchmark, lambda: [extract_units(t) for t in UNIT_INPUTS],
+              (Counter(expected) for _, expected in UNIT_CASES), key=unit_counts)
+
+
+@requires_benchmark
+def test_bench_doc_type_detection(benchmark):
+    run_bench(benchmark, lambda: [detect_doc_type(f) for f in DOC_TYPE_INPUTS],
+              (expected for _, expected in DOC_TYPE_CASES))
+
+
+# Named in-memory DB shared by every connection in this process; it lives
+# as long as one connection stays open, so no disk I/O or file cleanup.
+# Each pytest-xdist worker is its own process and so gets its own DB.
+MEMORY_DB_URI = "file:phase1_tests?mode=memory&cache=shared"
+
+
+def tune(conn):
+    """Test-connection PRAGMAs; returns the resulting journal mode."""
+    conn.executescript(
+        "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA temp_store=MEMORY; "
+        "PRAGMA busy_timeout=1000; PRAGMA cache_size=-8192;"
+    )
+    return conn.execute("PRAGMA journal_mode").fetchone()[0]
+
+
+@pytest.fixture(scope="session")
+def db_conn():
+    """One initialized in-memory SQLite test database and connection for the session."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(manual_core, "SQLITE_DB_PATH", MEMORY_DB_URI)
+        # Open first: init_sqlite_db closes its own connection
+        conn = get_db_connection()
+        # WAL on a file DB; SQLite keeps an in-memory DB's journal in memory
+        assert tune(conn) in ("wal", "memory")
+        init_sqlite_db()
+        yield conn
+        conn.close()
+
+
+def test_database_tables(db_conn):
+    """All required tables are created."""
+    cursor = db_conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = {row[0] for row in cursor.fetchall()}
+    assert EXPECTED_TABLES <= tables, f"Missing tables. Found: {tables}"
+
+
+def test_audit_logging(db_conn):
+    """log_audit_event writes one row with the given action and details."""
+    log_audit_event("test_action", "Test event details")
     
-    # Use a temporary database for testing
-    test_db = "test_manual_data.db"
+    # Filter on the action: the session DB is shared with the other DB tests,
+    # which may run first in any order (e.g. under pytest-xdist)
+    # One statement for both row count and content (window functions: SQLite 3.25+)
+    cursor = db_conn.cursor()
+    cursor.execute(
+        "SELECT COUNT(*) OVER(), action, details, user FROM audit_log WHERE action = 'test_action'"
+    )
+    assert cursor.fetchone() == (1, "test_action", "Test event details", "system")
+
+
+def test_audit_logging_bulk(db_conn):
+    """log_audit_events_bulk writes every event in one transaction."""
+    events = [("bulk_action", f"Event {i}", "tester") for i in range(100)]
+    log_audit_events_bulk(events)
     
-    # Clean up if exists
-    if os.path.exists(test_db):
-        os.remove(test_db)
+    cursor = db_conn.cursor()
+    cursor.execute("SELECT COUNT(*), COUNT(DISTINCT details), MIN(user) FROM audit_log WHERE action = 'bulk_action'")
+    assert cursor.fetchone() == (100, 100, "tester")
+
+
+
+def test_connection_reused(db_conn):
+    """get_db_connection reuses the thread's connection; close() only rolls back."""
+    conn = get_db_connection()
+    assert conn is db_conn
     
-    passed = 0
-    failed = 0
+    conn.execute("INSERT INTO audit_log (timestamp, user, action, details) VALUES ('t', 'u', 'uncommitted', '')")
+    conn.close()
     
-    # Temporarily override DB path
-    import manual_core
-    original_db_path = manual_core.SQLITE_DB_PATH
-    manual_core.SQLITE_DB_PATH = test_db
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT COUNT(*) FROM audit_log WHERE action = 'uncommitted'")
+    assert cursor.fetchone()[0] == 0
+
+
+def test_file_database(tmp_path, monkeypatch):
+    """A plain on-disk path works too, and takes WAL; tmp_path is removed by pytest."""
+    monkeypatch.setattr(manual_core, "SQLITE_DB_PATH", str(tmp_path / "t.db"))
+    init_sqlite_db()
+    log_audit_event("file_action", "On disk")
     
+    conn = get_db_connection()
     try:
-        # Test 1: Initialize database
-        init_sqlite_db()
-        if os.path.exists(test_db):
-            print(f"  ✓ Database created: {test_db}")
-            passed += 1
-        else:
-            print(f"  ✗ Database not created")
-            failed += 1
-        
-        # Test 2: Check tables
-        conn = get_db_connection()
+        assert tune(conn) == "wal"
         cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = [row[0] for row in cursor.fetchall()]
-        expected_tables = {'documents', 'chunks', 'topics', 'audit_log'}
-        
-        if expected_tables.issubset(set(tables)):
-            print(f"  ✓ All required tables created: {', '.join(expected_tables)}")
-            passed += 1
-        else:
-            print(f"  ✗ Missing tables. Found: {tables}")
-            failed += 1
-        
-        conn.close()
-        
-        # Test 3: Audit logging
-        log_audit_event("test_action", "Test event details")
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM audit_log")
-        count = cursor.fetchone()[0]
-        
-        if count == 1:
-            print(f"  ✓ Audit event logged successfully")
-            passed += 1
-        else:
-            print(f"  ✗ Audit log count incorrect: {count}")
-            failed += 1
-        
-        # Test 4: Verify audit log content
-        cursor.execute("SELECT action, details, user FROM audit_log")
-        row = cursor.fetchone()
-        
-        if row and row[0] == "test_action" and row[1] == "Test event details" and row[2] == "system":
-            print(f"  ✓ Audit log content correct")
-            passed += 1
-        else:
-            print(f"  ✗ Audit log content incorrect: {row}")
-            failed += 1
-        
-        conn.close()
-        
+        cursor.execute("SELECT action, details FROM audit_log")
+        assert cursor.fetchall() == [("file_action", "On disk")]
     finally:
-        # Restore original DB path
-        manual_core.SQLITE_DB_PATH = original_db_path
-        
-        # Clean up test database
-        if os.path.exists(test_db):
-            os.remove(test_db)
-    
-    return passed, failed
+        manual_core.close_db_connection()
 
 
-def main():
-    """Run all tests."""
-    print("="*70)
-    print("PHASE 1 FUNCTIONALITY TESTS")
-    print("="*70)
-    
-    total_passed = 0
-    total_failed = 0
+# The cached connection must stay open across the unlink for this to test
+# anything, and Windows refuses to delete a file that is still open
+@pytest.mark.skipif(sys.platform == "win32", reason="cannot unlink an open file on Windows")
+def test_connection_reopened_after_file_replaced(tmp_path, monkeypatch):
+    """A DB file deleted and recreated (as migrate_db does) gets a fresh cached connection."""
+    db_path = tmp_path / "t.db"
+    monkeypatch.setattr(manual_core, "SQLITE_DB_PATH", str(db_path))
+    init_sqlite_db()
+    log_audit_event("before", "old file")
     
-    # Run all test suites
-    test_suites = [
-        test_topic_id_generation,
-        test_emergency_detection,
-        test_unit_extraction,
-        test_doc_type_detection,
-        test_database_operations,
-    ]
-    
-    for test_func in test_suites:
-        try:
-            passed, failed = test_func()
-            total_passed += passed
-            total_failed += failed
-        except Exception as e:
-            print(f"\n  ✗ Test suite failed with error: {e}")
-            import traceback
-            traceback.print_exc()
-            total_failed += 1
-    
-    # Summary
-    print("\n" + "="*70)
-    print("TEST SUMMARY")
-    print("="*70)
-    print(f"  Passed: {total_passed}")
-    print(f"  Failed: {total_failed}")
-    print(f"  Total:  {total_passed + total_failed}")
+    db_path.unlink()
+    init_sqlite_db()
+    log_audit_event("after", "new file")
+    manual_core.close_db_connection()
     
-    if total_failed == 0:
-        print("\n  ✓ ALL TESTS PASSED!")
-        return 0
-    else:
-        print(f"\n  ✗ {total_failed} TEST(S) FAILED")
-        return 1
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT action FROM audit_log").fetchall() == [("after",)]
+    finally:
+        conn.close()
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    sys.exit(pytest.main([__file__]))